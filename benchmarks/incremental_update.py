@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Compares parsing a whole document again after a one-line edit with updating the previous Document, either with the
+edited line or with the whole edited source. The time taken by an edit should not grow with the document.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jotdown.classes import Document
+from jotdown.globalv import read_with_encoding
+from jotdown.parser import parse, math_cache
+
+sample_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'text.jd')
+
+
+def parse_source(source: str) -> Document:
+	math_cache.clear()  # Don't reuse formulas from earlier runs
+	return parse(line + '\n' for line in source.split('\n'))
+
+
+if __name__ == '__main__':
+	sample = read_with_encoding(sample_file)
+	print(f'{"copies":>8} {"lines":>7} {"parse (ms)":>11} {"edit (ms)":>10} {"source (ms)":>12}')
+	for copies in (1, 4, 16, 64):
+		lines = [line + '\n' for line in '\n\n'.join([sample] * copies).split('\n')]
+		source = ''.join(lines)
+		# Edit a line of a paragraph in the middle of the document, back and forth
+		middle = next(i for i in range(len(lines) // 2, len(lines)) if lines[i].startswith('This is'))
+		edits = [lines[middle], 'Edited ' + lines[middle]]
+		sources = [source, ''.join(lines[:middle] + edits[1:] + lines[middle + 1:])]
+
+		runs = max(1, 64 // copies)
+		parse_time = min(timeit.repeat(lambda: parse_source(sources[1]), number=runs, repeat=3)) / runs
+
+		doc = Document().update(source)
+		edit_runs = 200
+		edit_time = min(timeit.repeat(
+			lambda: [doc.update(edits[n % 2], middle + 1, middle + 2) for n in range(1, edit_runs + 1)],
+			number=1,
+			repeat=3
+		)) / edit_runs
+		source_time = min(timeit.repeat(
+			lambda: [doc.update(sources[n % 2]) for n in range(1, edit_runs + 1)],
+			number=1,
+			repeat=3
+		)) / edit_runs
+
+		print(
+			f'{copies:>8} {len(lines):>7} {parse_time * 1000:>11.2f} {edit_time * 1000:>10.3f}'
+			f' {source_time * 1000:>12.3f}'
+		)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Times the lexing and parsing of «««/»»» math blocks of increasing length. Time per line should stay flat.
+"""
+import os
+import sys
+from timeit import default_timer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jotdown.lexer import get_math_tokens, replace_math
+from jotdown.parser import parse, math_cache
+
+equations = [
+	'a^2 + b^2 = c^2',
+	'A -> B # This one has a comment # PHI(0) <= 4',
+	'sum[[j=2] n j] = (n*(n+1)/2) + 1',
+	'F(b) - F(a) = int[a b [f(x) dx]]',
+	'x = (-b +/- sqrt[b^2 - 4ac])/2a',
+]
+
+
+def math_block(n_lines: int) -> str:
+	return '\n'.join(equations[i % len(equations)] for i in range(n_lines)) + '\n'
+
+
+def best_of(repeat: int, fn, *args) -> float:
+	times = []
+	for _ in range(repeat):
+		start = default_timer()
+		fn(*args)
+		times.append(default_timer() - start)
+	return min(times)
+
+
+def tokenize(text: str) -> None:
+	for _ in get_math_tokens(1, text):
+		pass
+
+
+def parse_block(text: str) -> None:
+	math_cache.clear()  # Time parsing the formulas, not looking them up
+	parse(line + '\n' for line in ('«««\n' + text + '»»»').split('\n'))
+
+
+if __name__ == '__main__':
+	print(f'{"lines":>8} {"tokenize (ms)":>14} {"µs/line":>8} {"parse (ms)":>11} {"µs/line":>8}')
+	for n_lines in (1000, 2000, 4000, 8000, 16000):
+		text = replace_math(math_block(n_lines))
+		t_tokens = best_of(3, tokenize, text)
+		t_parse = best_of(3, parse_block, math_block(n_lines))
+		print(
+			f'{n_lines:>8} {t_tokens * 1e3:>14.1f} {t_tokens / n_lines * 1e6:>8.2f}'
+			f' {t_parse * 1e3:>11.1f} {t_parse / n_lines * 1e6:>8.2f}'
+		)
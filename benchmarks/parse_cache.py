@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Compares parsing a Jotdown file with loading it from a parse cache directory.
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jotdown.build import parse_file
+from jotdown.globalv import read_with_encoding
+from jotdown.parser import math_cache
+
+sample_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'text.jd')
+
+
+def parse_uncached(infile: str) -> None:
+	math_cache.clear()  # Don't reuse formulas from earlier runs
+	parse_file(infile)
+
+
+if __name__ == '__main__':
+	sample = read_with_encoding(sample_file)
+	print(f'{"copies":>8} {"source (KiB)":>13} {"parse (ms)":>11} {"load (ms)":>10} {"speedup":>8}')
+	with tempfile.TemporaryDirectory() as tmpdir:
+		cache_dir = os.path.join(tmpdir, 'cache')
+		for copies in (1, 4, 16, 64):
+			infile = os.path.join(tmpdir, f'sample{copies}.jd')
+			with open(infile, 'w', encoding='utf-8') as f:
+				f.write('\n\n'.join([sample] * copies))
+
+			runs = max(1, 64 // copies)
+			parse_time = min(timeit.repeat(lambda: parse_uncached(infile), number=runs, repeat=3)) / runs
+			parse_file(infile, cache_dir)  # Fill the cache
+			load_time = min(timeit.repeat(lambda: parse_file(infile, cache_dir), number=runs, repeat=3)) / runs
+			print(
+				f'{copies:>8} {os.path.getsize(infile) / 1024:>13.1f} {parse_time * 1000:>11.2f}'
+				f' {load_time * 1000:>10.2f} {parse_time / load_time:>8.1f}'
+			)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Measures the memory taken by parsed Documents, in bytes per byte of Jotdown source. It should stay flat as documents grow.
+The nodes of each Document are also copied into classes without __slots__, laid out like they were before they had
+them, with a list of children for every leaf, and into the classes they have, to compare the memory taken by the nodes
+alone in both layouts.
+"""
+import gc
+import os
+import sys
+import tracemalloc
+import typing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jotdown.classes as classes
+from jotdown.classes import Node
+from jotdown.globalv import read_with_encoding
+from jotdown.parser import parse, math_cache
+
+sample_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'text.jd')
+
+node_classes = [cls for cls in vars(classes).values() if isinstance(cls, type) and issubclass(cls, Node)]
+
+
+def slot_names(cls: type) -> typing.Tuple[str, ...]:
+	return tuple(i for base in reversed(cls.__mro__) for i in vars(base).get('__slots__', ()))
+
+
+def dict_classes() -> typing.Dict[type, type]:
+	"""
+	A copy of every Node class without __slots__, so that their instances keep their attributes in a __dict__
+	"""
+	copies = {object: object}
+
+	def copy(cls: type) -> type:
+		if cls not in copies:
+			namespace = {key: value for key, value in vars(cls).items() if key not in ('__slots__', '__dict__', '__weakref__')}
+			for name in vars(cls).get('__slots__', ()):
+				namespace.pop(name, None)
+			copies[cls] = type(cls.__name__, tuple(copy(base) for base in cls.__bases__), namespace)
+		return copies[cls]
+
+	for cls in node_classes:
+		copy(cls)
+	return copies
+
+
+def copy_tree(root: Node, layout: typing.Dict[type, type], own_children: bool=False) -> typing.Any:
+	"""
+	Copies root and every node it holds into the classes of layout. Nodes held more than once are copied once.
+	If own_children, every node gets a list of children of its own, even leaves, like before they shared an empty tuple
+	"""
+	copies = {}
+	pending = [root]
+	while pending:
+		node = pending.pop()
+		if id(node) in copies:
+			continue
+		copies[id(node)] = layout[type(node)].__new__(layout[type(node)])
+		for name in slot_names(type(node)):
+			value = getattr(node, name)
+			values = value if isinstance(value, (list, tuple)) else (value,)
+			pending.extend(i for i in values if isinstance(i, Node))
+
+	def copy_value(value: typing.Any) -> typing.Any:
+		if isinstance(value, Node):
+			return copies[id(value)]
+		if isinstance(value, list):
+			return [copy_value(i) for i in value]
+		if isinstance(value, tuple):
+			return tuple(copy_value(i) for i in value)
+		return value
+
+	nodes = {}
+	pending = [root]
+	while pending:
+		node = pending.pop()
+		if id(node) in nodes:
+			continue
+		nodes[id(node)] = node
+		for name in slot_names(type(node)):
+			value = getattr(node, name)
+			copied = copy_value(value)
+			if own_children and name == 'children':
+				copied = list(copied)
+			object.__setattr__(copies[id(node)], name, copied)
+			values = value if isinstance(value, (list, tuple)) else (value,)
+			pending.extend(i for i in values if isinstance(i, Node))
+	return copies[id(root)]
+
+
+def parsed_size(source: str, flat: bool=False) -> int:
+	"""
+	Bytes allocated by a Document parsed from source that are still held once parsing is done
+	"""
+	math_cache.clear()  # Don't count formulas shared with earlier runs
+	gc.collect()
+	tracemalloc.start()
+	before, _ = tracemalloc.get_traced_memory()
+	doc = parse((line + '\n' for line in source.split('\n')), flat=flat)
+	gc.collect()
+	after, _ = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	del doc
+	return after - before
+
+
+def copied_size(doc: Node, layout: typing.Dict[type, type], own_children: bool=False) -> int:
+	"""
+	Bytes allocated by a copy of the nodes of doc in layout, without the text and other values they share with it
+	"""
+	gc.collect()
+	tracemalloc.start()
+	before, _ = tracemalloc.get_traced_memory()
+	copy = copy_tree(doc, layout, own_children)
+	gc.collect()
+	after, _ = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	del copy
+	return after - before
+
+
+if __name__ == '__main__':
+	sample = read_with_encoding(sample_file)
+	slotted = {cls: cls for cls in node_classes}
+	unslotted = dict_classes()
+	print(
+		f'{"copies":>8} {"source (KiB)":>13} {"parsed (KiB)":>13} {"bytes/byte":>11} {"flat (KiB)":>11} {"bytes/byte":>11}'
+		f' {"nodes (KiB)":>12} {"no slots (KiB)":>15}'
+	)
+	for copies in (1, 4, 16, 64):
+		source = '\n\n'.join([sample] * copies)
+		source_size = len(source.encode('utf-8'))
+		size = parsed_size(source)
+		flat_size = parsed_size(source, flat=True)
+		doc = parse(line + '\n' for line in source.split('\n'))
+		nodes_size = copied_size(doc, slotted)
+		dict_size = copied_size(doc, unslotted, own_children=True)
+		print(
+			f'{copies:>8} {source_size / 1024:>13.1f} {size / 1024:>13.1f} {size / source_size:>11.2f}'
+			f' {flat_size / 1024:>11.1f} {flat_size / source_size:>11.2f}'
+			f' {nodes_size / 1024:>12.1f} {dict_size / 1024:>15.1f}'
+		)
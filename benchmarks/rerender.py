@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Compares emitting a whole Document to HTML with emitting it again after a one-line edit, when the output of every
+block that did not change is kept in the block cache.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jotdown.classes import Document, block_cache
+from jotdown.globalv import read_with_encoding
+
+sample_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'text.jd')
+stylesheet = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'styles', 'solarized.css')
+
+
+def emit_uncached(doc: Document) -> str:
+	block_cache.clear()
+	return doc.emit('html', stylesheet=stylesheet, ref_style=True)
+
+
+if __name__ == '__main__':
+	sample = read_with_encoding(sample_file)
+	print(f'{"copies":>8} {"blocks":>7} {"emit (ms)":>10} {"re-emit (ms)":>13} {"speedup":>8}')
+	for copies in (1, 4, 16, 64):
+		lines = [line + '\n' for line in '\n\n'.join([sample] * copies).split('\n')]
+		doc = Document().update(''.join(lines))
+		# Edit a line of a paragraph in the middle of the document, back and forth
+		middle = next(i for i in range(len(lines) // 2, len(lines)) if lines[i].startswith('This is'))
+		edits = [lines[middle], 'Edited ' + lines[middle]]
+
+		runs = max(1, 64 // copies)
+		emit_time = min(timeit.repeat(lambda: emit_uncached(doc), number=runs, repeat=3)) / runs
+
+		def edit_and_emit(n: int) -> str:
+			doc.update(edits[n % 2], middle + 1, middle + 2)
+			return doc.emit('html', stylesheet=stylesheet, ref_style=True)
+
+		reemit_runs = 50
+		reemit_time = min(timeit.repeat(
+			lambda: [edit_and_emit(n) for n in range(1, reemit_runs + 1)],
+			number=1,
+			repeat=3
+		)) / reemit_runs
+
+		print(
+			f'{copies:>8} {len(doc.children):>7} {emit_time * 1000:>10.2f} {reemit_time * 1000:>13.2f}'
+			f' {emit_time / reemit_time:>8.1f}'
+		)
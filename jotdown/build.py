@@ -0,0 +1,515 @@
+"""
+Compilation of Jotdown files and whole directory trees of them to an output format.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import typing
+
+import jotdown.globalv as globalv
+from jotdown.classes import Document, Heading, Node
+from jotdown.context import ParseContext, TocEntry
+from jotdown.errors import LineNumberException, MissingTagException
+from jotdown.flat import FlatTree
+from jotdown.parser import parse
+
+# Options shared by every file compiled by a worker process, set once when the worker starts
+_worker_options = {}
+
+
+def write_file(infile: str, outfile: str, fformat: str='html', cache_dir: str=None, **kwargs) -> bool:
+	"""
+	Compiles infile to outfile. Returns whether it was compiled without errors
+	"""
+	with open(outfile, 'wb') as fout:
+		try:
+			doc = parse_file(infile, cache_dir)
+			doc.name = os.path.splitext(os.path.split(infile)[1])[0]
+
+			doc.emit_to(fout, fformat, **kwargs)  # Output is hardcoded to utf-8
+			return True
+		except MissingTagException as e:
+			unpaired_name, unpaired_token, missing_token = e.unpaired_tag
+			if e.encountered_tag:
+				encountered_name, encountered_token, _ = e.encountered_tag
+				logging.error(f'in {infile} line {e.line_number}: {e} {unpaired_name} ("{missing_token}"), \
+but found {encountered_name} ("{encountered_token}") instead')
+			else:
+				logging.error(f'in {infile} line {e.line_number}: {e} {unpaired_name} ("{missing_token}")')
+		except LineNumberException as e:
+			logging.error(f'in {infile} line {e.line_number}: {e}')
+		except Exception as e:
+			logging.critical(e)
+			raise
+	return False
+
+
+def parse_file(infile: str, cache_dir: str=None) -> Document:
+	"""
+	Parses infile. If cache_dir is given, the parsed Document is kept there and loaded instead of parsing infile again,
+	for as long as infile and the version of Jotdown stay the same. The cache only holds data, no code, and it is only
+	read from files of the current user
+	"""
+	if not cache_dir:
+		return parse(globalv.read_lines_with_encoding(infile))
+
+	digest = hashlib.sha256(bytes(tool_version(), 'utf-8'))
+	_update_hash_file(digest, infile)
+	cache_file = os.path.join(cache_dir, digest.hexdigest() + '.json')
+
+	try:
+		with open(cache_file, encoding='utf-8') as f:
+			if hasattr(os, 'getuid') and os.fstat(f.fileno()).st_uid != os.getuid():
+				raise PermissionError('it belongs to another user')
+			return _load_document(f.read())
+	except FileNotFoundError:
+		pass
+	except (OSError, ValueError) as e:
+		logging.warning(f'Ignoring unreadable cached parse of {infile}: {e}')
+
+	doc = parse(globalv.read_lines_with_encoding(infile))
+
+	os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+	# Written to a temporary file first, so that other processes never load a partial one
+	fd, temp_file = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+	with os.fdopen(fd, 'w', encoding='utf-8') as f:
+		f.write(_dump_document(doc))
+	os.replace(temp_file, cache_file)
+	return doc
+
+
+def _dump_document(doc: Document) -> str:
+	"""
+	Serializes the children of doc, and the references of its context, as a FlatTree followed by a line of JSON
+	"""
+	tree = FlatTree()
+	tree.add(Node(doc.children))
+	references = []
+	for ref_key, content in doc.context.references.items():
+		if content is None:
+			references.append([ref_key, None, None])
+		else:
+			definition, text = content
+			references.append([ref_key, tree.add(definition), text])
+	tree.finish()
+
+	context = {
+		'author': doc.author,
+		'references': references,
+		'reference_numbers': doc.context.reference_numbers,
+		'anchor_counts': doc.context.anchor_counts,
+	}
+	return tree.dumps() + '\n' + json.dumps(context, ensure_ascii=False)
+
+
+def _load_document(data: str) -> Document:
+	"""
+	Loads a Document serialized by _dump_document. Raises ValueError if it is not valid
+	"""
+	tree_data, _, context_data = data.partition('\n')
+	tree = FlatTree.loads(tree_data)
+	try:
+		fields = json.loads(context_data)
+		context = ParseContext()
+		for ref_key, index, text in fields['references']:
+			context.references[ref_key] = None if index is None else (tree.unflatten(index), text)
+		context.reference_numbers = fields['reference_numbers']
+		context.anchor_counts = fields['anchor_counts']
+
+		doc = Document(tree.unflatten(0).children, author=fields['author'], context=context)
+		for child in doc.children:
+			if isinstance(child, Heading):
+				context.toc.append(TocEntry(child.level, child.ident, child))
+				context.html_ids.add(child.ident)
+	except (KeyError, TypeError, IndexError, AttributeError, json.JSONDecodeError) as e:
+		raise ValueError(f'Not a serialized Document: {e}') from e
+	context.finalize()
+	return doc
+
+
+class Manifest:
+	"""
+	Record of the files built into an output directory, so unchanged ones can be skipped by the next build.
+	Every output file is recorded with a hash of its source, the options and format it was compiled with,
+	and the version of Jotdown that compiled it. The same Manifest can be reused for consecutive builds
+	"""
+	file_name = '.jotdown-manifest.json'
+
+	def __init__(self, output_dir: str) -> None:
+		self.output_dir = output_dir
+		self.path = os.path.join(output_dir, self.file_name)
+		self.version = tool_version()
+		try:
+			with open(self.path, encoding='utf-8') as f:
+				self.entries = json.load(f)
+		except (OSError, ValueError):
+			self.entries = {}
+		self.new_entries = {}
+		self.changed = False
+		self.built = 0
+
+		# Sources that failed to compile, by (size, mtime). Only kept in memory, so they are retried by the next
+		# process but not by every build of a long-lived one
+		self.failed = {}
+
+	def _key(self, outfile: str) -> str:
+		return os.path.relpath(outfile, self.output_dir)
+
+	def is_fresh(self, outfile: str, fformat: str, options: dict, source: str=None, text: str=None) -> bool:
+		"""
+		Whether outfile was already built from the same source file (or source text) with the same options.
+		Fresh entries are kept for the next build
+		"""
+		key = self._key(outfile)
+		if source is not None and key in self.failed and self.failed[key] == _stat_key(source):
+			return True
+
+		entry = self.entries.get(key)
+		if (
+				not entry or not os.path.exists(outfile)
+				or entry['format'] != fformat or entry['options'] != options or entry['version'] != self.version
+		):
+			return False
+
+		if text is not None:
+			fresh = entry['hash'] == _hash(bytes(text, 'utf-8'))
+		else:
+			# Only hash the source if its size or modification time changed
+			size, mtime_ns = _stat_key(source)
+			if (size, mtime_ns) == (entry['size'], entry['mtime_ns']):
+				fresh = True
+			else:
+				fresh = entry['hash'] == _hash_file(source)
+				entry.update(size=size, mtime_ns=mtime_ns)
+				self.changed = True
+
+		if fresh:
+			self.new_entries[key] = entry
+		return fresh
+
+	def record(self, outfile: str, fformat: str, options: dict, source: str=None, text: str=None) -> None:
+		entry = {
+			'format': fformat,
+			'options': options,
+			'version': self.version,
+		}
+		if text is not None:
+			entry['hash'] = _hash(bytes(text, 'utf-8'))
+		else:
+			size, mtime_ns = _stat_key(source)
+			entry.update(
+				source=source,
+				hash=_hash_file(source),
+				size=size,
+				mtime_ns=mtime_ns,
+			)
+		key = self._key(outfile)
+		self.new_entries[key] = entry
+		self.failed.pop(key, None)
+		self.changed = True
+		self.built += 1
+
+	def record_failure(self, outfile: str, source: str) -> None:
+		"""
+		Skips source in later builds with this Manifest until it is modified
+		"""
+		self.failed[self._key(outfile)] = _stat_key(source)
+
+	def is_generated(self, outfile: str) -> bool:
+		"""
+		Whether outfile was generated by the last build rather than compiled from a source file
+		"""
+		entry = self.entries.get(self._key(outfile))
+		return bool(entry) and 'source' not in entry
+
+	def save(self) -> int:
+		"""
+		Writes the entries recorded or found fresh in this build, if any changed, and starts a new build.
+		Entries of files that were not built are dropped. Returns the number of files built
+		"""
+		if self.changed or self.new_entries.keys() != self.entries.keys():
+			with open(self.path, 'w', encoding='utf-8') as f:
+				json.dump(self.new_entries, f, indent='\t', sort_keys=True)
+
+		built = self.built
+		self.entries, self.new_entries = self.new_entries, {}
+		self.changed = False
+		self.built = 0
+		return built
+
+
+def tool_version() -> str:
+	"""
+	Identifies the version of Jotdown by a hash of its source code
+	"""
+	global _tool_version
+	if not _tool_version:
+		digest = hashlib.sha256()
+		package_dir = os.path.dirname(os.path.abspath(__file__))
+		for fname in sorted(os.listdir(package_dir)):
+			if fname.endswith('.py'):
+				with open(os.path.join(package_dir, fname), 'rb') as f:
+					digest.update(f.read())
+		_tool_version = digest.hexdigest()
+	return _tool_version
+
+
+_tool_version = None
+
+
+def _stat_key(path: str) -> typing.Tuple[int, int]:
+	stat = os.stat(path)
+	return stat.st_size, stat.st_mtime_ns
+
+
+def _hash(data: bytes) -> str:
+	return hashlib.sha256(data).hexdigest()
+
+
+def _hash_file(path: str) -> str:
+	digest = hashlib.sha256()
+	_update_hash_file(digest, path)
+	return digest.hexdigest()
+
+
+def _update_hash_file(digest: 'hashlib._Hash', path: str) -> None:
+	with open(path, 'rb') as f:
+		for chunk in iter(lambda: f.read(1 << 16), b''):
+			digest.update(chunk)
+
+
+def compile_directory(
+		input_dir: str,
+		output_dir: str,
+		fformat: str,
+		stylesheet: str,
+		ref_style: bool=True,
+		author: str=None,
+		jobs: int=1,
+		manifest: Manifest=None,
+		cache_dir: str=None,
+) -> int:
+	"""
+	Replicates the directory structure of input_dir under output_dir, compiling .jd files to fformat and copying
+	everything else verbatim. Files are compiled by a pool of jobs worker processes if jobs > 1.
+	Files that have not changed since the last build into output_dir are skipped. Returns the number of files built.
+	Parsed files are cached in cache_dir, if given, as with parse_file
+	"""
+	if not os.path.exists(output_dir):
+		os.makedirs(output_dir)
+	if not os.path.isdir(output_dir):
+		raise Exception(f'{output_dir} exists but is not a directory')
+	if os.path.realpath(output_dir).startswith(os.path.realpath(input_dir) + os.path.sep):
+		print(os.path.realpath(output_dir))
+		print(os.path.realpath(input_dir))
+		raise Exception('Output path cannot be a subdirectory of the input folder')
+
+	if manifest is None:
+		manifest = Manifest(output_dir)
+
+	# Copy the css file over to the new folder
+	stylesheet = _copy_file(stylesheet, os.path.join(output_dir, os.path.basename(stylesheet)), manifest)
+
+	options = {
+		'fformat': fformat,
+		'ref_style': ref_style,
+		'stylesheet': stylesheet,
+		'embed_css': False,
+		'link_translation': fformat,
+		'author': author,
+	}
+
+	sources = []
+	for in_dirpath, dirnames, filenames in os.walk(input_dir):
+		out_dirpath = os.path.join(output_dir, os.path.relpath(in_dirpath, input_dir))
+
+		# Need to create the directories if they dont exist to avoid errors
+		dirnames = list(dirnames)
+		dirnames.append('.')
+		for dname in dirnames:
+			path = os.path.join(out_dirpath, dname)
+			if not os.path.exists(path):
+				os.makedirs(path)
+
+		for in_fname in filenames:
+			if os.path.splitext(in_fname)[1] == '.jd':
+				infile = os.path.join(in_dirpath, in_fname)
+				outfile = os.path.join(out_dirpath, globalv.ext_translation(in_fname, fformat))
+				if not manifest.is_fresh(outfile, fformat, _file_options(outfile, options), source=infile):
+					sources.append((infile, outfile))
+			else:
+				_copy_file(os.path.join(in_dirpath, in_fname), os.path.join(out_dirpath, in_fname), manifest)
+
+	if sources:
+		logging.info(f'Compiling {len(sources)} changed files')
+	try:
+		# The cache only changes how files are parsed, not what they compile to
+		compile_options = dict(options, cache_dir=cache_dir)
+		for infile, outfile, compiled in _compile_files(sources, compile_options, jobs):
+			if compiled:
+				manifest.record(outfile, fformat, _file_options(outfile, options), source=infile)
+			else:
+				manifest.record_failure(outfile, infile)
+		_write_index_files(output_dir, options, manifest)
+	finally:
+		built = manifest.save()
+	return built
+
+
+def _copy_file(infile: str, outfile: str, manifest: Manifest) -> str:
+	if not manifest.is_fresh(outfile, 'copy', {}, source=infile):
+		shutil.copy(infile, outfile)
+		manifest.record(outfile, 'copy', {}, source=infile)
+	return outfile
+
+
+def _file_options(outfile: str, options: dict) -> dict:
+	"""
+	The options a file is compiled with, with the stylesheet relative to the file
+	"""
+	options = dict(options)
+	options['stylesheet'] = os.path.relpath(options['stylesheet'], os.path.dirname(outfile))
+	return options
+
+
+def _compile_files(
+		sources: typing.List[typing.Tuple[str, str]],
+		options: dict,
+		jobs: int
+) -> typing.Iterator[typing.Tuple[str, str, bool]]:
+	"""
+	Compiles every (infile, outfile) pair. Yields them along with whether they were compiled without errors
+	"""
+	if jobs <= 1 or len(sources) <= 1:
+		for infile, outfile in sources:
+			yield infile, outfile, _compile_file(infile, outfile, options)
+		return
+
+	# Largest files first, so that no worker is left compiling a big file after all others are done
+	sources = sorted(sources, key=lambda source: os.path.getsize(source[0]), reverse=True)
+	with ProcessPoolExecutor(
+			max_workers=jobs,
+			initializer=_init_worker,
+			initargs=(options, logging.getLogger().level)
+	) as executor:
+		futures = [executor.submit(_compile_file, infile, outfile) for infile, outfile in sources]
+		for (infile, outfile), future in zip(sources, futures):
+			yield infile, outfile, future.result()  # Re-raises any unexpected error from the workers
+
+
+def _init_worker(options: dict, log_level: int) -> None:
+	logging.basicConfig(level=log_level, format='{levelname} {message}', style='{')
+	_worker_options.update(options)
+
+
+def _compile_file(infile: str, outfile: str, options: dict=None) -> bool:
+	return write_file(infile, outfile, **_file_options(outfile, options if options else _worker_options))
+
+
+def _write_index_files(output_dir: str, options: dict, manifest: Manifest) -> None:
+	"""
+	Create index files for all folders. They may be overwritten by custom pages
+	"""
+	fformat = options['fformat']
+	index_fname = globalv.ext_translation('index.jd', fformat)
+
+	for out_dirpath, dirnames, filenames in os.walk(output_dir):
+		outfile = os.path.join(out_dirpath, index_fname)
+		if index_fname not in filenames or manifest.is_generated(outfile):
+			_, name = os.path.split(out_dirpath)
+			index_file = ['#' + name]
+
+			if dirnames:
+				index_file.append('## Directories')
+			for index_dir in dirnames:
+				index_file.append('[' + index_dir + '](' + os.path.join(index_dir, index_fname) + ')' + '\n')
+
+			filenames = [i for i in filenames if i not in (index_fname, Manifest.file_name)]
+			if filenames:
+				index_file.append('## Files')
+			for index_filename in filenames:
+				_, in_fname = os.path.split(index_filename)
+				file_name, _ = os.path.splitext(in_fname)
+				index_file.append('[' + file_name + '](' + in_fname + ')' + '\n')
+
+			index_text = '\n\n'.join(index_file)
+			index_options = _file_options(outfile, options)
+			if manifest.is_fresh(outfile, fformat, index_options, text=index_text):
+				continue
+
+			index_doc = parse(StringIO(index_text))
+			index_doc.name = 'Index for ' + name
+
+			with open(outfile, 'wb') as fout:
+				index_doc.emit_to(
+					fout,
+					fformat,
+					stylesheet=os.path.relpath(options['stylesheet'], out_dirpath),
+					embed_css=False,
+					link_translation=fformat,
+					author=options['author'],
+				)
+			manifest.record(outfile, fformat, index_options, text=index_text)
+
+
+def watch(build: typing.Callable[[], int], interval: float=0.5) -> None:
+	"""
+	Calls build every interval seconds until interrupted, reporting how long every build that compiled any files took.
+	build returns the number of files it compiled. Errors are logged, once while they repeat, and watching goes on,
+	since they are usually fixed by the next edit
+	"""
+	last_error = None
+	try:
+		while True:
+			start = time.perf_counter()
+			try:
+				built = build()
+			except Exception as e:
+				error = f'{e.__class__.__name__}: {e}'
+				if error != last_error:
+					logging.error(f'Build failed, waiting for changes. {error}')
+				last_error = error
+				built = 0
+			else:
+				last_error = None
+			if built:
+				elapsed = (time.perf_counter() - start) * 1000
+				print(f'{time.strftime("%H:%M:%S")} Built {built} file{"s" if built != 1 else ""} in {elapsed:.1f} ms')
+			time.sleep(interval)
+	except KeyboardInterrupt:
+		pass
+
+
+def watch_file(infile: str, outfile: str, interval: float=0.5, **kwargs) -> None:
+	"""
+	Compiles infile to outfile every time it is modified
+	"""
+	last_stat = None
+
+	def build() -> int:
+		nonlocal last_stat
+		try:
+			stat = _stat_key(infile)
+		except FileNotFoundError:
+			return 0  # Unchanged: editors that save by replacing the file remove it for a moment
+		if stat == last_stat:
+			return 0
+		last_stat = stat
+		write_file(infile, outfile, **kwargs)
+		return 1
+
+	watch(build, interval)
+
+
+def watch_directory(input_dir: str, output_dir: str, interval: float=0.5, **kwargs) -> None:
+	"""
+	Rebuilds output_dir from input_dir with compile_directory every time any file in it is modified
+	"""
+	manifest = Manifest(output_dir)
+	watch(lambda: compile_directory(input_dir, output_dir, manifest=manifest, **kwargs), interval)
@@ -0,0 +1,56 @@
+"""
+In-memory caches shared by every document parsed or emitted by the process.
+"""
+from collections import OrderedDict
+import threading
+import typing
+
+
+class LRUCache:
+	"""
+	Mapping of bounded size that evicts its least recently used entries first, keeping statistics of its use.
+	It is shared by documents in every thread, so it is only used while holding its lock
+	"""
+	def __init__(self, maxsize: int) -> None:
+		self.lock = threading.Lock()
+		self.maxsize = maxsize
+		self.entries: typing.MutableMapping[typing.Hashable, typing.Any] = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def get(self, key: typing.Hashable, default: typing.Any=None) -> typing.Any:
+		with self.lock:
+			try:
+				value = self.entries[key]
+			except KeyError:
+				self.misses += 1
+				return default
+			self.entries.move_to_end(key)
+			self.hits += 1
+			return value
+
+	def put(self, key: typing.Hashable, value: typing.Any) -> None:
+		with self.lock:
+			self.entries[key] = value
+			self.entries.move_to_end(key)
+			while len(self.entries) > self.maxsize:
+				self.entries.popitem(last=False)
+				self.evictions += 1
+
+	def clear(self) -> None:
+		with self.lock:
+			self.entries.clear()
+
+	def stats(self) -> typing.Dict[str, int]:
+		with self.lock:
+			return {
+				'hits': self.hits,
+				'misses': self.misses,
+				'evictions': self.evictions,
+				'size': len(self.entries),
+				'maxsize': self.maxsize,
+			}
+
+	def __len__(self) -> int:
+		return len(self.entries)
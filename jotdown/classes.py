@@ -1,134 +1,262 @@
 # -*- coding: utf-8 -*-
+import hashlib
 import html
 import os
 import re
 from getpass import getuser
 from socket import gethostname
-from typing import Sequence, Iterable
+from typing import Sequence, Iterable, Iterator, Union, Callable, Any, BinaryIO, Dict, Tuple, Type, FrozenSet
 import logging
 
 import jotdown.globalv as globalv
-from jotdown.regex import latex_math_subst
+import jotdown.stylesheets as stylesheets
+from jotdown.cache import LRUCache
+from jotdown.context import ParseContext
+from jotdown.regex import latex_math_table
+
+re_html_tag = re.compile(r'<[^>]*>', flags=globalv.re_flags)
+re_whitespace = re.compile(r'\s', flags=globalv.re_flags)
+
+# A piece of emitted output: either text, or an iterator of more fragments that is emitted in its place.
+# Nodes yield the iterators of their children instead of emitting them, so that the emitter can walk the tree
+# with an explicit stack instead of recursion
+Fragment = Union[str, Iterator['Fragment']]
+
+
+def iter_joined(nodes: Iterable['Node'], string: str, fmt: str, **kwargs) -> Iterator[Fragment]:
+	"""
+	Fragments for the output of nodes in fmt, separated by string
+	"""
+	method = f'iter_{fmt}'
+	for n, node in enumerate(nodes):
+		if n and string:
+			yield string
+		yield getattr(node, method)(**kwargs)
+
+
+def write_fragments(fragment: Fragment, write: Callable[[str], Any]) -> None:
+	"""
+	Passes the text of fragment to write one piece at a time, walking nested iterators with an explicit stack
+	"""
+	if isinstance(fragment, str):
+		write(fragment)
+		return
+
+	stack = [fragment]
+	while stack:
+		for fragment in stack[-1]:
+			if isinstance(fragment, str):
+				write(fragment)
+			else:
+				stack.append(fragment)
+				break
+		else:
+			stack.pop()
+
+
+def join_fragments(fragment: Fragment) -> str:
+	res = []
+	write_fragments(fragment, res.append)
+	return ''.join(res)
+
+
+# Children of every leaf Node. Immutable, so one is shared by all of them
+no_children = ()
 
 
 # Abstract ---------------------------------
 class Node:
+	__slots__ = ('children',)
+
 	def __init__(self, children: Iterable['Node']=None) -> None:
-		self.children = children if children else []
+		self.children = children if children is not None else []
+
+	def emit_to(self, stream: BinaryIO, fmt: str, chunk_size: int=1 << 16, **kwargs) -> None:
+		"""
+		Emits this node and its descendants in fmt to stream, encoded as UTF-8. The output is written as it is
+		emitted, in chunks of about chunk_size characters, so it is never held in memory as a whole
+		"""
+		chunk = []
+		size = 0
+
+		def write(fragment: str) -> None:
+			nonlocal size
+			chunk.append(fragment)
+			size += len(fragment)
+			if size >= chunk_size:
+				stream.write(''.join(chunk).encode('utf-8'))
+				chunk.clear()
+				size = 0
+
+		write_fragments(getattr(self, f'iter_{fmt}')(**kwargs), write)
+		if chunk:
+			stream.write(''.join(chunk).encode('utf-8'))
+
+	def emit(self, fmt: str, **kwargs) -> str:
+		return join_fragments(getattr(self, f'iter_{fmt}')(**kwargs))
+
+	def iter_children(self, string: str, fmt: str, **kwargs) -> Iterator[Fragment]:
+		return iter_joined(self.children, string, fmt, **kwargs)
 
 	def join_children(self, string: str, fmt: str, **kwargs) -> str:
-		return string.join(getattr(i, f'emit_{fmt}')(**kwargs) for i in self.children)
+		return string.join(i.emit(fmt, **kwargs) for i in self.children)
+
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		return self.iter_children('', 'html', **kwargs)
+
+	def iter_rtf(self, **kwargs) -> Iterator[Fragment]:
+		return self.iter_children('', 'rtf', **kwargs)
+
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		return self.iter_children('', 'latex', **kwargs)
+
+	def iter_debug(self, indent: int=0, **kwargs) -> Iterator[Fragment]:
+		yield ('\t' * indent) + self.__class__.__name__ + '\n'
+		yield from self.iter_children('', 'debug', indent=indent + 1, **kwargs)
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		return self.iter_children('', 'jd', **kwargs)
+
+	def iter_plain(self, **kwargs) -> Iterator[Fragment]:
+		return self.iter_children('', 'plain', **kwargs)
 
 	def emit_html(self, **kwargs) -> str:
-		return self.join_children('', 'html', **kwargs)
+		return self.emit('html', **kwargs)
+
+	def emit_mathml(self, **kwargs) -> str:
+		return self.emit('mathml', **kwargs)
 
 	def emit_rtf(self, **kwargs) -> str:
-		return self.join_children('', 'rtf', **kwargs)
+		return self.emit('rtf', **kwargs)
 
 	def emit_latex(self, **kwargs) -> str:
-		return self.join_children('', 'latex', **kwargs)
+		return self.emit('latex', **kwargs)
 
-	def emit_debug(self, indent: int=0, **kwargs) -> str:
-		return ('\t' * indent) + type(self).__name__ + '\n' + ''.join(i.emit_debug(indent + 1, **kwargs) for i in self.children)
+	def emit_debug(self, **kwargs) -> str:
+		return self.emit('debug', **kwargs)
 
 	def emit_jd(self, **kwargs) -> str:
-		return self.join_children('', 'jd', **kwargs)
+		return self.emit('jd', **kwargs)
 
 	def emit_plain(self, **kwargs) -> str:
-		return self.join_children('', 'plain', **kwargs)
+		return self.emit('plain', **kwargs)
 
 
 class TextNode(Node):
+	__slots__ = ('text',)
+
+	# LATEX needs these characters escaped in source files
+	latex_escape_table = str.maketrans({
+		'\\': r'\textbackslash ',
+		'&': r'\& ',
+		'%': r'\%',
+		'$': r'\$',
+		'#': r'\#',
+		'_': r'\_',
+		'{': r'\{',
+		'}': r'\}',
+		'~': r'\textasciitilde ',
+		'^': r'\textasciicircum ',
+		'—': r'---',  # em dash
+		'–': r'--',   # en dash
+		'>': r'\textgreater ',
+		'<': r'\textless ',
+	})
+
 	def __init__(self, text: str) -> None:
-		super().__init__()
+		super().__init__(no_children)
 		self.text = text
 
-	def emit_html(self, **kwargs) -> str:
-		return html.escape(self.text, quote=True)
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield html.escape(self.text, quote=True)
 
-	def emit_rtf(self, **kwargs) -> str:
-		return globalv.rtf_escape_unicode(self.text)
+	def iter_rtf(self, **kwargs) -> Iterator[Fragment]:
+		yield globalv.rtf_escape_unicode(self.text)
 
-	def emit_latex(self, **kwargs) -> str:
-		special_chars = (
-			# LATEX needs these characters escaped in source files
-			('\\', r'\textbackslash '),
-		    ('&', r'\& '),
-		    ('%', r'\%'),
-		    ('$', r'\$'),
-		    ('#', r'\#'),
-		    ('_', r'\_'),
-		    ('{', r'\{'),
-		    ('}', r'\}'),
-		    ('~', r'\textasciitilde '),
-		    ('^', r'\textasciicircum '),
-			('—', r'---'),  # em dash
-			('–', r'--'),   # en dash
-			('>', r'\textgreater '),
-			('<', r'\textless '),
-		)
-		text = self.text
-		for old, new in special_chars:
-			text = text.replace(old, new)
-		return text
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield self.text.translate(self.latex_escape_table)
 
-	def emit_debug(self, indent: int=0, **kwargs) -> str:
+	def iter_debug(self, indent: int=0, **kwargs) -> Iterator[Fragment]:
 		summary = repr(self.text[:50])
 		if len(self.text) > len(summary):
 			summary += '...'
-		res = ('\t' * indent) + type(self).__name__ + ' ' + summary + '\n'
-		res += self.join_children('', 'debug', indent=indent + 1)
-		return res
+		yield ('\t' * indent) + self.__class__.__name__ + ' ' + summary + '\n'
+		yield from self.iter_children('', 'debug', indent=indent + 1)
 
-	def emit_jd(self, **kwargs) -> str:
-		return self.text
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		yield self.text
 
-	emit_plain = emit_jd
+	iter_plain = iter_jd
 
 
 # For blocks -------------------------------------------------------------------------
 
 
 class Document(Node):
-	def __init__(self, children: Sequence[Node]=None, name: str="Jotdown Document", author: str=None) -> None:
+	__slots__ = ('name', 'author', 'hostname', 'context', 'source', 'block_keys')
+
+	def __init__(
+			self,
+			children: Sequence[Node]=None,
+			name: str="Jotdown Document",
+			author: str=None,
+			context: ParseContext=None
+	) -> None:
 		super().__init__(children)
 		self.name = name
 		self.author = getuser() if not author else author
 		self.hostname = gethostname()
-
-	def emit_html(self, stylesheet: str, ref_style: bool=False, embed_css: bool=True, **kwargs) -> str:
+		self.context = context if context else ParseContext()
+		self.source = None  # Split into Blocks by update, to parse it again one Block at a time
+		# Structure hash and cited references of each child emitted so far, by id, with the child and its list of
+		# children when it was hashed. Holding them keeps their ids from being reused
+		self.block_keys: Dict[int, Tuple[Node, list, int, bytes, Tuple[str, ...]]] = {}
+
+	def update(self, source: str, start: int=None, end: int=None) -> 'Document':
+		"""
+		Parses an edited source again, only where it changed, and updates the Document with it. source is either the
+		whole new source, or, if start is given, the lines that replace the ones from start up to, but not including,
+		end, counted from 1. The first update must be given the whole source
+		"""
+		from jotdown.parser import update
+		return update(self, source, start, end)
+
+	def iter_html(self, stylesheet: str, ref_style: bool=False, embed_css: bool=True, **kwargs) -> Iterator[Fragment]:
 		if embed_css:
-			css_string = f'<style>{globalv.read_with_encoding(stylesheet)}</style>'
+			css_string = f'<style>{stylesheets.read_stylesheet(stylesheet)}</style>'
 		else:
 			css_string = f'<link rel="stylesheet" href="{stylesheet}"/>'
 
-		body = self.join_children('\n', 'html', ref_style=ref_style)
 		# TODO: Author and creation time meta tags
-		return f'''<!DOCTYPE html><html>
+		yield f'''<!DOCTYPE html><html>
 <head>
 <title>{self.name}</title>
 <meta charset="UTF-8">{css_string}
 </head>
 <body>
-{body}
-<footer>{ReferenceList().emit_html(ref_style=True, **kwargs) if ref_style else ""}</footer>
+'''
+		yield from self.iter_children('\n', 'html', ref_style=ref_style, context=self.context)
+		yield '\n<footer>'
+		if ref_style:
+			yield self._iter_references('html', ref_style=True, context=self.context, **kwargs)
+		yield '''</footer>
 </body>
 </html>
 '''
 
-	def emit_rtf(self, stylesheet: str, **kwargs) -> str:
+	def iter_rtf(self, stylesheet: str, **kwargs) -> Iterator[Fragment]:
 		# TODO: Author in info, and create time
-		return rf'''{{\rtf1\ansi\deff0\widowctrl {globalv.read_with_encoding(stylesheet)}
+		yield rf'''{{\rtf1\ansi\deff0\widowctrl {stylesheets.read_stylesheet(stylesheet)}
 {{\info
 {{\title {self.name}}}
 {{\author PLACEHOLDER}}
 {{\creatim\yr2016\mo7\dy20\hr18\min37}}
 }}
-{self.join_children("", "rtf", **kwargs)}
-}}
 '''
+		yield from self.iter_children('', 'rtf', context=self.context, **kwargs)
+		yield '\n}\n'
 
-	def emit_latex(self, stylesheet: str, ref_style: bool=False, **kwargs) -> str:
+	def iter_latex(self, stylesheet: str, ref_style: bool=False, **kwargs) -> Iterator[Fragment]:
 		packages = r'''
 \usepackage[utf8]{inputenc}
 \usepackage{amsmath}
@@ -140,37 +268,177 @@ class Document(Node):
 		field_dict = {
 			'packages': packages,
 			'title': self.name,
-			'body': self.join_children('', 'latex', ref_style=ref_style, **kwargs),
-			'references': ReferenceList().emit_latex(ref_style=True, **kwargs) if ref_style else '',
+			'body': self.iter_children('', 'latex', ref_style=ref_style, context=self.context, **kwargs),
+			'references': self._iter_references('latex', ref_style=True, context=self.context, **kwargs) if ref_style else '',
 			'author': self.author,
 			'institution': self.hostname,
 		}
-		return globalv.read_with_encoding(stylesheet) % field_dict
-
-	def emit_plain(self, **kwargs) -> str:
-		return self.join_children('\n', 'plain', **kwargs)
+		template = stylesheets.load_template(stylesheet)
+		if template.parts is None:
+			field_dict = {key: join_fragments(value) for key, value in field_dict.items()}
+		yield from template.iter_fill(field_dict)
+
+	def iter_plain(self, **kwargs) -> Iterator[Fragment]:
+		return self.iter_children('\n', 'plain', **kwargs)
+
+	def iter_children(self, string: str, fmt: str, **kwargs) -> Iterator[Fragment]:
+		"""
+		Like Node.iter_children, but the output of each child is kept in block_cache, and reused while neither its
+		structure, the options it is emitted with, nor the document-wide state it depends on change.
+		The structure of a child is only hashed again if its list of children is replaced or changes length, so
+		children that were emitted must be replaced, as update does, instead of changed deeper than that
+		"""
+		context = kwargs.get('context', self.context)
+		options = tuple(sorted((key, value) for key, value in kwargs.items() if key != 'context'))
+		try:
+			hash(options)
+		except TypeError:
+			yield from super().iter_children(string, fmt, **kwargs)
+			return
+
+		method = f'iter_{fmt}'
+		definition_keys = {}  # References cited by the definition of each reference, by its key
+		block_keys = {}
+		for n, child in enumerate(self.children):
+			if n and string:
+				yield string
+
+			entry = self.block_keys.get(id(child))
+			if entry is None or entry[1] is not child.children or entry[2] != len(child.children):
+				entry = (child, child.children, len(child.children), *structure_hash(child))
+			block_keys[id(child)] = entry
+			structure, ref_keys = entry[3:]
+
+			key = (structure, fmt, options, _block_state(child, ref_keys, context, definition_keys))
+			emitted = block_cache.get(key)
+			if emitted is None:
+				emitted = join_fragments(getattr(child, method)(**kwargs))
+				block_cache.put(key, emitted)
+			yield emitted
+
+		# Forget the children that are gone
+		self.block_keys.clear()
+		self.block_keys.update(block_keys)
+
+	def _iter_references(self, fmt: str, **kwargs) -> Iterator[Fragment]:
+		# Only list the references once the children are emitted, which may be parsed while being emitted
+		yield getattr(ReferenceList(self.context), f'iter_{fmt}')(**kwargs)
+
+
+# Output of the children of Documents, by their structure, the format and options they were emitted with,
+# and the document-wide state they depend on
+block_cache = LRUCache(4096)
+
+# Attributes that are not part of the structure of a node: caches of its output, and document-wide state
+_unstructured_slots = {'children', 'emitted', 'ident'}
+_structure_slots: Dict[Type[Node], Tuple[str, ...]] = {}
+
+
+def structure_hash(node: Node) -> Tuple[bytes, Tuple[str, ...]]:
+	"""
+	Returns a hash of the types and attributes of node and its descendants, and the keys of the references they cite
+	"""
+	tokens = []
+	ref_keys = []
+	stack = [node]
+	while stack:
+		node = stack.pop()
+		if isinstance(node, str):  # End of a node
+			tokens.append(node)
+			continue
+
+		cls = node.__class__
+		slots = _structure_slots.get(cls)
+		if slots is None:
+			slots = _structure_slots[cls] = tuple(
+				i for base in reversed(cls.__mro__) for i in vars(base).get('__slots__', ())
+				if i not in _unstructured_slots
+			)
+		if isinstance(node, ReferenceLink):
+			ref_keys.append(node.ref_key)
+
+		tokens.append(f'({cls.__name__}')
+		stack.append(')')
+		for child in reversed(node.children):
+			stack.append(child)
+		for name in slots:
+			value = getattr(node, name)
+			if isinstance(value, Node):
+				stack.append(value)
+				tokens.append(name)
+			elif isinstance(value, (list, tuple)):
+				# Element by element, since the repr of a Node holds its address, which may be reused by another
+				tokens.append(f'{name}[{len(value)}')
+				for i in value:
+					if isinstance(i, Node):
+						stack.append(i)
+						tokens.append('*')
+					else:
+						tokens.append(repr(i))
+			else:
+				tokens.append(f'{name}={value!r}')
+
+	structure = '\0'.join(tokens).encode('utf-8', 'surrogatepass')
+	return hashlib.blake2b(structure, digest_size=16).digest(), tuple(ref_keys)
+
+
+def _block_state(
+		node: Node,
+		ref_keys: Tuple[str, ...],
+		context: ParseContext,
+		definition_keys: Dict[str, Tuple[str, ...]]
+) -> Tuple:
+	"""
+	The document-wide state the output of a child of a Document depends on: its anchor, if it is a Heading,
+	and the place and definition of the references it cites, and of the ones cited by those definitions, which may be
+	emitted in their place. definition_keys keeps the references cited by each definition, as they are found
+	"""
+	if not ref_keys:
+		return getattr(node, 'ident', None),
+
+	references = []
+	seen = set()
+	pending = list(ref_keys)
+	while pending:
+		ref_key = pending.pop()
+		if ref_key in seen:
+			continue
+		seen.add(ref_key)
+		definition, text = context.references.get(ref_key) or (None, None)
+		references.append((ref_key, context.reference_numbers.get(ref_key), text))
+		if definition is not None:
+			if ref_key not in definition_keys:
+				definition_keys[ref_key] = structure_hash(definition)[1]
+			pending.extend(definition_keys[ref_key])
+	return getattr(node, 'ident', None), context.finalized, tuple(references)
 
 
 class Heading(Node):
-	def __init__(self, level: int, children: Sequence[Node]=None) -> None:
+	__slots__ = ('level', 'ident')
+
+	def __init__(self, level: int, children: Sequence[Node]=None, ident: str=None) -> None:
 		super().__init__(children)
 		self.level = min(level, 6)
+		self.ident = ident  # Anchor, unique in the Document. Given by its ParseContext
+
+	def anchor(self, context: ParseContext) -> str:
+		"""
+		Base anchor of the heading, made from its HTML in citation mode without the tags. Links to headings depend on it
+		"""
+		ident = self.join_children('', 'html', context=context, ref_style=True).strip()
+		ident = re_html_tag.sub('', ident)
+		ident = re_whitespace.sub('-', ident)
+		return html.escape(ident)
+
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		if self.ident is not None:
+			yield f'<h{self.level} id="{self.ident}">'
+		else:
+			yield f'<h{self.level}>'
+		yield from self.iter_children('<br>', 'html', **kwargs)
+		yield f'</h{self.level}>'
 
-	def emit_html(self, **kwargs) -> str:
-		# Sanitize the text for the id
-		ident = self.join_children('', 'html', **kwargs).strip()
-		ident = re.sub(r'<[^>]*>', '', ident, flags=globalv.re_flags)
-		ident = re.sub(r'\s', '-', ident, flags=globalv.re_flags)
-		ident = html.escape(ident)
-
-		# Make sure it's unique on the whole document
-		while ident in globalv.html_document_ids:
-			ident += '_'
-		globalv.html_document_ids.add(ident)
-
-		return f'<h{self.level} id="{ident}">{self.join_children("<br>", "html", **kwargs)}</h{self.level}>'
-
-	def emit_rtf(self, **kwargs) -> str:
+	def iter_rtf(self, **kwargs) -> Iterator[Fragment]:
 		# TODO: Distinguish between levels of headings
 		styles = {
 			# level: style index
@@ -181,256 +449,342 @@ class Heading(Node):
 			5: 4,
 			6: 4
 		}
-		body = self.join_children(r'\line', 'rtf', **kwargs)
-		return rf'{{\pard\sa180\sb90\keepn\s{styles[self.level]} {body}\par}}'
+		yield rf'{{\pard\sa180\sb90\keepn\s{styles[self.level]} '
+		yield from self.iter_children(r'\line', 'rtf', **kwargs)
+		yield r'\par}'
 
-	def emit_latex(self, **kwargs) -> str:
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
 		levels = {
 			1: r'\section{',
 			2: r'\subsection{',
 			3: r'\subsubsection{',
 		}
-		body = r'\\'.join(i.emit_latex(**kwargs) for i in self.children)
-		return levels.get(self.level, rf'\subsubsection{{{body}}}\n')
+		if self.level in levels:
+			yield levels[self.level]
+		else:
+			yield r'\subsubsection{'
+			yield from self.iter_children(r'\\', 'latex', **kwargs)
+			yield r'}\n'
 
-	def emit_jd(self, **kwargs) -> str:
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
 		# TODO: Emit the other style of heading canonically?
-		return f'{"#" * self.level} {self.join_children("", "jd", **kwargs)}\n\n'
+		yield '#' * self.level + ' '
+		yield from self.iter_children('', 'jd', **kwargs)
+		yield '\n\n'
 
 
 class HorizontalRule(Node):
-	def emit_html(self, **kwargs) -> str:
-		return '<hr/>'
+	__slots__ = ()
 
-	def emit_latex(self, **kwargs) -> str:
-		return '\n' r'\rule{\textwidth}{1pt}' '\n'
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield '<hr/>'
 
-	def emit_jd(self, **kwargs) -> str:
-		return '---\n\n'
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield '\n' r'\rule{\textwidth}{1pt}' '\n'
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		yield '---\n\n'
 
 
 class ListNode(Node):
-	pass
+	__slots__ = ()
 
 
 class UList(ListNode):
-	def emit_html(self, **kwargs) -> str:
-		return f'<ul>{"".join(i.emit_html(**kwargs) for i in self.children)}</ul>'
+	__slots__ = ()
 
-	def emit_latex(self, **kwargs) -> str:
-		return rf'''\begin{{itemize}}
-{self.join_children("", "latex", **kwargs)}
-\end{{itemize}}
-'''
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield '<ul>'
+		yield from self.iter_children('', 'html', **kwargs)
+		yield '</ul>'
 
-	def emit_jd(self, depth: int=0, **kwargs) -> str:
-		list_res = []
-		for list_item in self.children:
-			list_item_res = []
-			for node in list_item.children:
-					list_item_res.append(node.emit_jd(depth=depth + 1, **kwargs))
-			list_res.append('\t' * depth + f'* {"".join(list_item_res)}')
-		return '\n'.join(list_res) + ('\n' if depth == 0 else '')
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield '\\begin{itemize}\n'
+		yield from self.iter_children('', 'latex', **kwargs)
+		yield '\n\\end{itemize}\n'
+
+	def iter_jd(self, depth: int=0, **kwargs) -> Iterator[Fragment]:
+		for n, list_item in enumerate(self.children):
+			if n:
+				yield '\n'
+			yield '\t' * depth + '* '
+			yield from iter_joined(list_item.children, '', 'jd', depth=depth + 1, **kwargs)
+		if depth == 0:
+			yield '\n'
 
 
 class OList(ListNode):
+	__slots__ = ('start', 'list_type')
+
 	def __init__(self, children: Sequence[Node]=None, list_type: str='1', start: int=1) -> None:
 		super().__init__(children)
 		self.start = start
 		self.list_type = list_type
 
-	def emit_html(self, **kwargs) -> str:
-		return f'<ol start="{self.start}" type="{self.list_type}">\
-		{self.join_children("", "html", **kwargs)}</ol>'
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield f'<ol start="{self.start}" type="{self.list_type}">'
+		yield from self.iter_children('', 'html', **kwargs)
+		yield '</ol>'
 
-	def emit_latex(self, **kwargs) -> str:
-		return rf'''\begin{{enumerate}}
-{self.join_children("", "latex", **kwargs)}
-\end{{enumerate}}'''
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield '\\begin{enumerate}\n'
+		yield from self.iter_children('', 'latex', **kwargs)
+		yield '\n\\end{enumerate}'
 
-	def emit_jd(self, depth: int=0, **kwargs) -> str:
-		list_res = []
+	def iter_jd(self, depth: int=0, **kwargs) -> Iterator[Fragment]:
 		for n, list_item in enumerate(self.children):
-			list_item_res = []
-			for node in list_item.children:
-				list_item_res.append(node.emit_jd(depth=depth + 1, **kwargs))
+			if n:
+				yield '\n'
 			# TODO: Support the other list types
-			list_res.append('\t' * depth + str(n + 1) + f' {"".join(list_item_res)}')
-		return '\n'.join(list_res) + ('\n' if depth == 0 else '')
+			yield '\t' * depth + str(n + 1) + ' '
+			yield from iter_joined(list_item.children, '', 'jd', depth=depth + 1, **kwargs)
+		if depth == 0:
+			yield '\n'
 
 
 class CheckList(UList):
-	def emit_html(self, **kwargs) -> str:
-		return f'<ul class="checklist">{self.join_children("", "html", **kwargs)}</ul>'
+	__slots__ = ()
+
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield '<ul class="checklist">'
+		yield from self.iter_children('', 'html', **kwargs)
+		yield '</ul>'
 
 
 class ReferenceList(OList):
-	def __init__(self) -> None:
-		items = [ReferenceItem(ref_key, content[0]) for ref_key, content in globalv.references.items()]
+	__slots__ = ()
+
+	def __init__(self, context: ParseContext) -> None:
+		items = []
+		for ref_key, content in context.references.items():
+			if not content:
+				raise Exception(f'Missing definition for reference "{ref_key}"')
+			items.append(ReferenceItem(ref_key, content[0]))
 		super().__init__(items, '1')
 
-	def emit_html(self, **kwargs) -> str:
-		return f'<ol class="references" start="{self.start}">{self.join_children("", "html", **kwargs)}</ol>'
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield f'<ol class="references" start="{self.start}">'
+		yield from self.iter_children('', 'html', **kwargs)
+		yield '</ol>'
 
-	def emit_latex(self, **kwargs) -> str:
-		body = "\n".join(i.emit_latex(**kwargs) for i in self.children)
-		return rf'''\begin{{thebibliography}}{{{len(globalv.references)}}}
-{body}
-\end{{thebibliography}}
-'''
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield f'\\begin{{thebibliography}}{{{len(self.children)}}}\n'
+		yield from self.iter_children('\n', 'latex', **kwargs)
+		yield '\n\\end{thebibliography}\n'
 
 
 class ListItem(Node):
-	def emit_html(self, **kwargs) -> str:
-		res = [f'<li><span>{"".join(i.emit_html(**kwargs) for i in self.children[:-1])}']
+	__slots__ = ()
+
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield '<li><span>'
+		yield from iter_joined(self.children[:-1], '', 'html', **kwargs)
 
 		if self.children and isinstance(self.children[-1], ListNode):
-			res.append(f'</span>{self.children[-1].emit_html(**kwargs)}')
+			yield '</span>'
+			yield self.children[-1].iter_html(**kwargs)
 		elif self.children:
-			res.append(f'{self.children[-1].emit_html(**kwargs)}</span>')
-
-		return ''.join(res)
+			yield self.children[-1].iter_html(**kwargs)
+			yield '</span>'
 
-	def emit_latex(self, **kwargs) -> str:
-		return rf'\item {self.join_children("", "latex", **kwargs)}\n'
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield r'\item '
+		yield from self.iter_children('', 'latex', **kwargs)
+		yield r'\n'
 
 
 class ChecklistItem(Node):
+	__slots__ = ('checked',)
+
 	def __init__(self, checked: bool, children: Sequence[Node]=None):
 		self.checked = checked
 		super().__init__(children)
 
-	def emit_html(self, **kwargs) -> str:
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
 		css_class = 'checked' if self.checked else 'unchecked'
-		res = [f'<li class="{css_class}"><span>{"".join(i.emit_html(**kwargs) for i in self.children[:-1])}']
+		yield f'<li class="{css_class}"><span>'
+		yield from iter_joined(self.children[:-1], '', 'html', **kwargs)
 
 		if self.children and isinstance(self.children[-1], ListNode):
-			res.append(f'</span>{self.children[-1].emit_html(**kwargs)}')
+			yield '</span>'
+			yield self.children[-1].iter_html(**kwargs)
 		elif self.children:
-			res.append(f'{self.children[-1].emit_html(**kwargs)}</span>')
-
-		return ''.join(res)
+			yield self.children[-1].iter_html(**kwargs)
+			yield '</span>'
 
 
 class ReferenceItem(Node):
+	__slots__ = ('ref_key', 'content')
+
 	def __init__(self, ref_key, content) -> None:
 		self.ref_key = ref_key
 		self.content = content
 		super().__init__()
 
-	def emit_html(self, **kwargs) -> str:
-		return f'<li><a id="{self.ref_key}"><span>{self.content.emit_html(**kwargs)}</span></a></li>'
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield f'<li><a id="{self.ref_key}"><span>'
+		yield self.content.iter_html(**kwargs)
+		yield '</span></a></li>'
 
-	def emit_latex(self, **kwargs) -> str:
-		return rf'\bibitem{{{self.ref_key}}} {self.content.emit_latex(**kwargs)} '
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield rf'\bibitem{{{self.ref_key}}} '
+		yield self.content.iter_latex(**kwargs)
+		yield ' '
 
 
 class Paragraph(Node):
-	def emit_html(self, **kwargs) -> str:
-		return f'<p>{self.join_children("<br>", "html", **kwargs)}</p>'
+	__slots__ = ()
 
-	def emit_rtf(self, **kwargs) -> str:
-		return r'{\pard\s1 %s\par}' % self.join_children(r'\line', 'rtf', **kwargs)
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield '<p>'
+		yield from self.iter_children('<br>', 'html', **kwargs)
+		yield '</p>'
 
-	def emit_latex(self, **kwargs) -> str:
-		return r'\par %s' % self.join_children(r'\\ ', 'latex', **kwargs)
+	def iter_rtf(self, **kwargs) -> Iterator[Fragment]:
+		yield r'{\pard\s1 '
+		yield from self.iter_children(r'\line', 'rtf', **kwargs)
+		yield r'\par}'
 
-	def emit_jd(self, **kwargs) -> str:
-		return f'{self.join_children("", "jd", **kwargs)} \n'
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield r'\par '
+		yield from self.iter_children(r'\\ ', 'latex', **kwargs)
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		yield from self.iter_children('', 'jd', **kwargs)
+		yield ' \n'
 
 
 class CodeBlock(Node):
-	def emit_html(self, **kwargs) -> str:
-		return f'<code class="console">{self.join_children("", "html", **kwargs)}</code>'
+	__slots__ = ()
 
-	def emit_rtf(self, **kwargs) -> str:
-		body = self.join_children(r'\line ', 'rtf', **kwargs)
-		return rf'''
-{{\pard\sa180\li720\ri720\keep\f2
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield '<code class="console">'
+		yield from self.iter_children('', 'html', **kwargs)
+		yield '</code>'
+
+	def iter_rtf(self, **kwargs) -> Iterator[Fragment]:
+		yield r'''
+{\pard\sa180\li720\ri720\keep\f2
 \brdrt\brdrs\brdrw10\brsp20
 \brdrl\brdrs\brdrw10\brsp80
 \brdrb\brdrs\brdrw10\brsp20
 \brdrr\brdrs\brdrw10\brsp80
-{body}
-\par}}
 '''
-
-	def emit_latex(self, **kwargs) -> str:
-		return rf'''\begin{{lstlisting}}
-{self.join_children("", "latex", **kwargs)}
-\end{{lstlisting}}
+		yield from self.iter_children(r'\line ', 'rtf', **kwargs)
+		yield r'''
+\par}
 '''
 
-	def emit_jd(self, **kwargs) -> str:
-		return f'```\n{self.join_children("", "jd", **kwargs)}\n```'
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield '\\begin{lstlisting}\n'
+		yield from self.iter_children('', 'latex', **kwargs)
+		yield '\n\\end{lstlisting}\n'
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		yield '```\n'
+		yield from self.iter_children('', 'jd', **kwargs)
+		yield '\n```'
 
 
 class MathBlock(Node):
-	def emit_html(self, **kwargs) -> str:
-		return f'<div class="math">{self.join_children("<br>", "html", **kwargs)}</div>'
+	__slots__ = ()
 
-	def emit_rtf(self, **kwargs) -> str:
-		body = self.join_children(r'line ', 'rtf', **kwargs)
-		return rf'''
-{{\pard\sa180\li720\ri720\keep
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield '<div class="math">'
+		yield from self.iter_children('<br>', 'html', **kwargs)
+		yield '</div>'
+
+	def iter_rtf(self, **kwargs) -> Iterator[Fragment]:
+		yield r'''
+{\pard\sa180\li720\ri720\keep
 \brdrt\brdrs\brdrw10\brsp20
 \brdrl\brdrs\brdrw10\brsp80
 \brdrb\brdrs\brdrw10\brsp20
 \brdrr\brdrs\brdrw10\brsp80
-{body}
-\par}}
 '''
-
-	def emit_latex(self, **kwargs) -> str:
-		body = self.join_children('\n', 'latex', **kwargs)
-		return rf'''\begin{{gather*}}
-{body}
-\end{{gather*}}
+		yield from self.iter_children(r'line ', 'rtf', **kwargs)
+		yield r'''
+\par}
 '''
 
-	def emit_jd(self, **kwargs) -> str:
-		return f'«««\n{self.join_children("", "jd", **kwargs)}\n»»»'
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield '\\begin{gather*}\n'
+		yield from self.iter_children('\n', 'latex', **kwargs)
+		yield '\n\\end{gather*}\n'
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		yield '«««\n'
+		yield from self.iter_children('', 'jd', **kwargs)
+		yield '\n»»»'
 
 
 class Blockquote(Node):
-	def emit_html(self, **kwargs) -> str:
-		return f'<blockquote>{self.join_children("<br>", "html", **kwargs)}</blockquote>'
+	__slots__ = ()
 
-	def emit_rtf(self, **kwargs) -> str:
-		body = self.join_children(r'\line ', 'rtf', **kwargs)
-		return rf'''
-{{\pard\sa180\li720\ri720\keep\f1
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield '<blockquote>'
+		yield from self.iter_children('<br>', 'html', **kwargs)
+		yield '</blockquote>'
+
+	def iter_rtf(self, **kwargs) -> Iterator[Fragment]:
+		yield r'''
+{\pard\sa180\li720\ri720\keep\f1
 \brdrt\brdrs\brdrw10\brsp20
 \brdrl\brdrs\brdrw10\brsp80
 \brdrb\brdrs\brdrw10\brsp20
 \brdrr\brdrs\brdrw10\brsp80
-{body}
-\par}}
 '''
-
-	def emit_latex(self, **kwargs) -> str:
-		body = self.join_children(r'\\', 'latex', **kwargs)
-		return rf'''\begin{{displayquote}}
-{body}
-\end{{displayquote}}
+		yield from self.iter_children(r'\line ', 'rtf', **kwargs)
+		yield r'''
+\par}
 '''
 
-	def emit_jd(self, **kwargs) -> str:
-		return ''.join('>' + i.emit_jd(**kwargs) for i in self.children) + '\n'
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield '\\begin{displayquote}\n'
+		yield from self.iter_children(r'\\', 'latex', **kwargs)
+		yield '\n\\end{displayquote}\n'
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		for i in self.children:
+			yield '>'
+			yield i.iter_jd(**kwargs)
+		yield '\n'
 
 
 class Math(Node):
-	def emit_html(self, **kwargs) -> str:
-		return self.join_children('', 'html', **kwargs)
+	__slots__ = ('emitted',)
 
-	def emit_latex(self, **kwargs) -> str:
-		text = self.join_children('', 'latex', **kwargs)
-		for regex, subst in latex_math_subst:
-			text = text.replace(regex, subst)
-		return text
+	def __init__(self, children: Sequence[Node]=None) -> None:
+		super().__init__(children)
+		# Output by format. Formulas don't depend on the options they are emitted with or where they are
+		self.emitted: Dict[str, str] = {}
+
+	def _emitted(self, fmt: str, fragments: Iterator[Fragment]) -> str:
+		if fmt not in self.emitted:
+			self.emitted[fmt] = join_fragments(fragments)
+		return self.emitted[fmt]
+
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield self._emitted('html', self.iter_children('', 'html', **kwargs))
+
+	def iter_rtf(self, **kwargs) -> Iterator[Fragment]:
+		yield self._emitted('rtf', self.iter_children('', 'rtf', **kwargs))
+
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		if 'latex' not in self.emitted:
+			self.emitted['latex'] = self.join_children('', 'latex', **kwargs).translate(latex_math_table)
+		yield self.emitted['latex']
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		yield self._emitted('jd', self.iter_children('', 'jd', **kwargs))
+
+	def iter_plain(self, **kwargs) -> Iterator[Fragment]:
+		yield self._emitted('plain', self.iter_children('', 'plain', **kwargs))
 
 
 class Table(Node):
+	__slots__ = ('caption', 'alignment')
+
 	latex_alignment_map = {
 		0: 'l',
 		1: 'c',
@@ -442,50 +796,63 @@ class Table(Node):
 		self.caption = caption
 		self.alignment = alignment
 
-	def emit_html(self, **kwargs) -> str:
-		caption_html = f'<caption>{"".join(i.emit_html(**kwargs) for i in self.caption)}</caption>' if self.caption else ''
-		return f'''<table>
-{caption_html}
-<thead>{self.children[0].emit_html(**kwargs)}</thead>
-<tbody>{"".join(i.emit_html(**kwargs) for i in self.children[1:])}</tbody>
-</table>
-'''
-
-	def emit_latex(self, **kwargs) -> str:
-		caption_latex = rf'\caption{{{"".join(i.emit_latex(**kwargs) for i in self.caption)}}}' if self.caption else ''
-		alignment_string = f'{{{"|".join(self.latex_alignment_map[i] for i in self.alignment)}}}'
-		body = ' \\\\\n'.join(i.emit_latex(**kwargs) for i in self.children[1:])
-
-		return rf'''\begin{{table}}
-{caption_latex}
-\begin{{tabular}}{alignment_string}
-{self.children[0].emit_latex(**kwargs)}\\ \hline
-{body}
-\end{{tabular}}
-\end{{table}}
-'''
-
-	def emit_jd(self, **kwargs) -> str:
-		return f'«{self.join_children("", "jd", **kwargs)}»'
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield '<table>\n'
+		if self.caption:
+			yield '<caption>'
+			yield from iter_joined(self.caption, '', 'html', **kwargs)
+			yield '</caption>'
+		yield '\n<thead>'
+		yield self.children[0].iter_html(**kwargs)
+		yield '</thead>\n<tbody>'
+		yield from iter_joined(self.children[1:], '', 'html', **kwargs)
+		yield '</tbody>\n</table>\n'
+
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield '\\begin{table}\n'
+		if self.caption:
+			yield r'\caption{'
+			yield from iter_joined(self.caption, '', 'latex', **kwargs)
+			yield '}'
+		yield f'\n\\begin{{tabular}}{{{"|".join(self.latex_alignment_map[i] for i in self.alignment)}}}\n'
+		yield self.children[0].iter_latex(**kwargs)
+		yield '\\\\ \\hline\n'
+		yield from iter_joined(self.children[1:], ' \\\\\n', 'latex', **kwargs)
+		yield '\n\\end{tabular}\n\\end{table}\n'
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		yield '«'
+		yield from self.iter_children('', 'jd', **kwargs)
+		yield '»'
 
 
 class TableRow(Node):
-	def emit_html(self, **kwargs) -> str:
-		return f'<tr>{self.join_children("", "html", **kwargs)}</tr>'
+	__slots__ = ()
 
-	def emit_latex(self, **kwargs) -> str:
-		return self.join_children(' & ', 'latex', **kwargs)
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield '<tr>'
+		yield from self.iter_children('', 'html', **kwargs)
+		yield '</tr>'
+
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		return self.iter_children(' & ', 'latex', **kwargs)
 
 
 class TableHeader(Node):
-	def emit_html(self, **kwargs) -> str:
-		return f'<th>{self.join_children("", "html", **kwargs)}</th>'
+	__slots__ = ()
 
-	def emit_latex(self, **kwargs) -> str:
-		return self.join_children('', 'latex', **kwargs)
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield '<th>'
+		yield from self.iter_children('', 'html', **kwargs)
+		yield '</th>'
+
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		return self.iter_children('', 'latex', **kwargs)
 
 
 class TableCell(Node):
+	__slots__ = ('align',)
+
 	html_align_map = {
 		0: 'left',
 		1: 'center',
@@ -496,14 +863,18 @@ class TableCell(Node):
 		super().__init__(children=children)
 		self.align = align
 
-	def emit_html(self, **kwargs) -> str:
-		return f'<td style="text-align: {self.html_align_map[self.align]};">{self.join_children("", "html", **kwargs)}</td>'
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield f'<td style="text-align: {self.html_align_map[self.align]};">'
+		yield from self.iter_children('', 'html', **kwargs)
+		yield '</td>'
 
-	def emit_latex(self, **kwargs) -> str:
-		return self.join_children('', 'latex', **kwargs)
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		return self.iter_children('', 'latex', **kwargs)
 
 
 class Link(Node):
+	__slots__ = ('url', 'linked_text', 'ignore_link_translation')
+
 	def __init__(self, linked_text: Node, url: str, ignore_link_translation: bool=False) -> None:
 		# TODO: make this take a generic list of children instead of linked_text node
 		super().__init__([linked_text])
@@ -511,38 +882,45 @@ class Link(Node):
 		self.linked_text = linked_text
 		self.ignore_link_translation = ignore_link_translation
 
-	def emit_html(self, link_translation: str=None, **kwargs) -> str:
+	def iter_html(self, link_translation: str=None, **kwargs) -> Iterator[Fragment]:
 		url = self.url
 		if link_translation and not self.ignore_link_translation:
 			url = globalv.ext_translation(url, link_translation)
 
-		return f'<a href="{url}">{self.linked_text.emit_html(link_translation=link_translation, **kwargs)}</a>'
+		yield f'<a href="{url}">'
+		yield self.linked_text.iter_html(link_translation=link_translation, **kwargs)
+		yield '</a>'
 
-	def emit_rtf(self, link_translation: str=None, **kwargs) -> str:
+	def iter_rtf(self, link_translation: str=None, **kwargs) -> Iterator[Fragment]:
 		if link_translation and not self.ignore_link_translation:
 			url = globalv.ext_translation(self.url, link_translation)
 		else:
 			url = self.url
 
-		linked_cited = self.linked_text.emit_html(link_translation=link_translation, **kwargs)
-
-		return rf'''{{\field{{\*\fldinst{{HYPERLINK "{url}"
+		yield rf'''{{\field{{\*\fldinst{{HYPERLINK "{url}"
 }}}}{{\fldrslt{{\ul
-{linked_cited}
-}}}}}}'''
+'''
+		yield self.linked_text.iter_html(link_translation=link_translation, **kwargs)
+		yield '\n}}}'
 
-	def emit_latex(self, link_translation: str=None, **kwargs) -> str:
+	def iter_latex(self, link_translation: str=None, **kwargs) -> Iterator[Fragment]:
 		url = self.url
 		if link_translation and not self.ignore_link_translation:
 			url = globalv.ext_translation(url, link_translation)
-		return rf' \href{{{url}}}{{{self.linked_text.emit_latex(link_translation=link_translation, **kwargs)}}} '
+		yield rf' \href{{{url}}}{{'
+		yield self.linked_text.iter_latex(link_translation=link_translation, **kwargs)
+		yield '} '
 
-	def emit_jd(self, **kwargs) -> str:
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
 		# No extension translation needed when exporting to .jd
-		return f'[{self.linked_text.emit_jd(**kwargs)}]({self.url})'
+		yield '['
+		yield self.linked_text.iter_jd(**kwargs)
+		yield f']({self.url})'
 
 
 class ReferenceLink(Node):
+	__slots__ = ('cited_node', 'ref_key')
+
 	def __init__(self, cited_node: Node, ref_key: str) -> None:
 		# TODO:  make this take a generic list of children instead of a singleton cited_node
 		# TODO: make sure the ref_key is globally unique
@@ -550,89 +928,130 @@ class ReferenceLink(Node):
 		self.cited_node = cited_node
 		self.ref_key = ref_key
 
-	def _check_ref_exists(self) -> None:
-		if not globalv.references[self.ref_key]:
-			raise Exception(f'Missing definition for reference "{self.ref_key}"')
-
-	def emit_html(self, link_translation: str=None, ref_style: bool=False, **kwargs) -> str:
-		self._check_ref_exists()
+	def _check_ref_exists(self, context: ParseContext, citation: bool=False) -> None:
+		if context.references[self.ref_key]:
+			return
+		if not context.finalized:
+			if citation:
+				# Only its place is needed for now, the definition is checked when the ReferenceList is emitted
+				return
+			raise Exception(f'Reference "{self.ref_key}" is not defined yet, emit it once the Document is parsed')
+		raise Exception(f'Missing definition for reference "{self.ref_key}"')
+
+	def iter_html(
+			self,
+			context: ParseContext,
+			link_translation: str=None,
+			ref_style: bool=False,
+			**kwargs
+	) -> Iterator[Fragment]:
+		self._check_ref_exists(context, citation=ref_style)
 
 		if ref_style:
-			place = list(globalv.references.keys()).index(self.ref_key) + 1
-			emitted_html = self.cited_node.emit_html(
+			place = context.reference_numbers[self.ref_key]
+			yield self.cited_node.iter_html(
+				context=context,
 				link_translation=link_translation,
 				ref_style=True,
 				**kwargs
 			)
-			return f'{emitted_html}<cite>[<a href="#{self.ref_key}" class="reference">{place}</a>]</cite>'
+			yield f'<cite>[<a href="#{self.ref_key}" class="reference">{place}</a>]</cite>'
 		else:
-			_, href = globalv.references[self.ref_key]
+			_, href = context.references[self.ref_key]
 			href = html.escape(href)
 			if link_translation:
 				href = globalv.ext_translation(href, link_translation)
-			return f'<a href="{href}">{self.cited_node}</a>'
-
-	def emit_rtf(self, link_translation: str=None, ref_style: bool=False, **kwargs) -> str:
-		self._check_ref_exists()
+			yield f'<a href="{href}">{self.cited_node}</a>'
+
+	def iter_rtf(
+			self,
+			context: ParseContext,
+			link_translation: str=None,
+			ref_style: bool=False,
+			expanding: FrozenSet[str]=frozenset(),
+			**kwargs
+	) -> Iterator[Fragment]:
+		self._check_ref_exists(context)
 
-		cited_emmited = self.cited_node.emit_rtf(
+		cited = self.cited_node.iter_rtf(
+			context=context,
 			link_translation=link_translation,
 			ref_style=ref_style,
+			expanding=expanding,
 			**kwargs
 		)
 		if ref_style:
-			ref, _ = globalv.references[self.ref_key]
-			ref_emmited = ref.emit_rtf(
+			# Footnotes hold the definitions they cite, so the ones being expanded are kept to stop at a cycle
+			if self.ref_key in expanding:
+				raise Exception(f'Reference "{self.ref_key}" cites itself')
+			ref, _ = context.references[self.ref_key]
+			yield cited
+			yield r'{\super\chftn}{\footnote\pard\plain\chftn '
+			yield ref.iter_rtf(
+				context=context,
 				link_translation=link_translation,
 				ref_style=True,
+				expanding=expanding | {self.ref_key},
 				**kwargs
 			)
-			return rf'{cited_emmited}{{\super\chftn}}{{\footnote\pard\plain\chftn {ref_emmited}}}'
+			yield '}'
 		else:
-			_, href = globalv.references[self.ref_key]
+			_, href = context.references[self.ref_key]
 			href = html.escape(href)
 			if link_translation:
 				href = globalv.ext_translation(href, link_translation)
-			return rf'''{{\field{{\*\fldinst{{HYPERLINK
+			yield rf'''{{\field{{\*\fldinst{{HYPERLINK
 "{href}"
 }}}}{{\fldrslt{{\ul
-{cited_emmited}
-}}}}}}'''
-
-	def emit_latex(self, link_translation: str=None, ref_style: bool=False, **kwargs) -> str:
-		self._check_ref_exists()
+'''
+			yield cited
+			yield '\n}}}'
+
+	def iter_latex(
+			self,
+			context: ParseContext,
+			link_translation: str=None,
+			ref_style: bool=False,
+			**kwargs
+	) -> Iterator[Fragment]:
+		self._check_ref_exists(context, citation=ref_style)
 
 		if ref_style:
-			ref_emmited = self.cited_node.emit_latex(
+			yield self.cited_node.iter_latex(
+				context=context,
 				link_translation=link_translation,
 				ref_style=True,
 				**kwargs
 			)
-			return rf'{ref_emmited} \cite{{{self.ref_key}}}'
+			yield rf' \cite{{{self.ref_key}}}'
 		else:
-			_, href = globalv.references[self.ref_key]
+			_, href = context.references[self.ref_key]
 			href = html.escape(href)
 			if link_translation:
 				href = globalv.ext_translation(href, link_translation)
-			return rf' \href{{{href}}}{{{self.cited_node}}}'
+			yield rf' \href{{{href}}}{{{self.cited_node}}}'
 
 
 class ImplicitLink(Link):
+	__slots__ = ()
+
 	def __init__(self, linked_text: Node, url: str) -> None:
 		super().__init__(linked_text, url, ignore_link_translation=True)
 
-	def emit_jd(self, **kwargs) -> str:
-		return self.linked_text.emit_jd(**kwargs)
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		return self.linked_text.iter_jd(**kwargs)
 
 
 class Content(Node):
+	__slots__ = ('alt', 'src', 'title')
+
 	def __init__(self, alt: Node, src: str, title: Node, children: Sequence[Node]=None) -> None:
 		super().__init__(children)
 		self.alt = alt
 		self.src = src
 		self.title = title if title else TextNode('')
 
-	def emit_html(self, **kwargs) -> str:
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
 		# TODO: Allow embedding of data to eliminate the need to link to it (maybe even downloading stuff from the web
 		dtype = globalv.content_filetypes(self.src)
 		attributes = {
@@ -652,314 +1071,454 @@ class Content(Node):
 			template = '<object data="%(src)s"></object>'
 
 		# TODO: make figures a command line option
-		return f'<figure>{template % attributes}<figcaption>{self.title.emit_html(**kwargs)}</figcaption></figure>'
+		yield f'<figure>{template % attributes}<figcaption>'
+		yield self.title.iter_html(**kwargs)
+		yield '</figcaption></figure>'
 
-	def emit_latex(self, **kwargs) -> str:
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
 		dtype = globalv.content_filetypes(self.src)
 		if dtype == 'image':
 			elem = rf'\includegraphics[width=\textwidth]{{{self.src}}}'
 		else:
 			elem = ''
 
-		return rf'''
-\begin{{figure}}
-\begin{{center}}
-\caption{{{self.title.emit_latex(**kwargs)}}}
+		yield r'''
+\begin{figure}
+\begin{center}
+\caption{'''
+		yield self.title.iter_latex(**kwargs)
+		yield rf'''}}
 {elem}
 \end{{center}}
 \end{{figure}}
 '''
 
-	def emit_jd(self, **kwargs) -> str:
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
 		title_text = self.title.emit_jd(**kwargs)
 		title = f' "{title_text}"' if title_text else ''
-		return f'![{self.alt.emit_jd(**kwargs)}]({self.src}{title})'
+		yield '!['
+		yield self.alt.iter_jd(**kwargs)
+		yield f']({self.src}{title})'
 
 
 # For text ----------------------------------------------------------------------
 
 
 class Plaintext(TextNode):
-	pass
+	__slots__ = ()
 
 
 # TODO: Shouldn't this be a text node?
 class CodeInline(Node):
-	def emit_html(self, **kwargs) -> str:
-		return f'<code>{self.join_children("", "html", **kwargs)}</code>'
+	__slots__ = ()
 
-	def emit_latex(self, **kwargs) -> str:
-		return rf'\texttt{{{self.join_children("", "latex", **kwargs)}}}'
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield '<code>'
+		yield from self.iter_children('', 'html', **kwargs)
+		yield '</code>'
 
-	def emit_jd(self, **kwargs) -> str:
-		return f'`{self.join_children("", "jd", **kwargs)}`'
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield r'\texttt{'
+		yield from self.iter_children('', 'latex', **kwargs)
+		yield '}'
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		yield '`'
+		yield from self.iter_children('', 'jd', **kwargs)
+		yield '`'
 
 
 class Emph(Node):
-	def emit_html(self, **kwargs) -> str:
-		return f'<em>{self.join_children("", "html", **kwargs)}</em>'
+	__slots__ = ()
 
-	def emit_rtf(self, **kwargs) -> str:
-		return rf'{{\i {self.join_children("", "rtf", **kwargs)}}}'
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield '<em>'
+		yield from self.iter_children('', 'html', **kwargs)
+		yield '</em>'
 
-	def emit_latex(self, **kwargs) -> str:
-		return rf'\textit{{{self.join_children("", "latex", **kwargs)}}}'
+	def iter_rtf(self, **kwargs) -> Iterator[Fragment]:
+		yield r'{\i '
+		yield from self.iter_children('', 'rtf', **kwargs)
+		yield '}'
 
-	def emit_jd(self, **kwargs) -> str:
-		return f'*{self.join_children("", "jd", **kwargs)}*'
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield r'\textit{'
+		yield from self.iter_children('', 'latex', **kwargs)
+		yield '}'
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		yield '*'
+		yield from self.iter_children('', 'jd', **kwargs)
+		yield '*'
 
 
 class Strong(Node):
-	def emit_html(self, **kwargs) -> str:
-		return f'<strong>{self.join_children("", "html", **kwargs)}</strong>'
+	__slots__ = ()
 
-	def emit_rtf(self, **kwargs) -> str:
-		return rf'{{\b {self.join_children("", "rtf", **kwargs)}}}'
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield '<strong>'
+		yield from self.iter_children('', 'html', **kwargs)
+		yield '</strong>'
 
-	def emit_latex(self, **kwargs) -> str:
-		return rf'\textbf{{{self.join_children("", "latex", **kwargs)}}}'
+	def iter_rtf(self, **kwargs) -> Iterator[Fragment]:
+		yield r'{\b '
+		yield from self.iter_children('', 'rtf', **kwargs)
+		yield '}'
 
-	def emit_jd(self, **kwargs) -> str:
-		return f'**{self.join_children("", "jd", **kwargs)}**'
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield r'\textbf{'
+		yield from self.iter_children('', 'latex', **kwargs)
+		yield '}'
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		yield '**'
+		yield from self.iter_children('', 'jd', **kwargs)
+		yield '**'
 
 
 class StrongEmph(Node):
-	def emit_html(self, **kwargs) -> str:
-		return f'<strong><em>{self.join_children("", "html", **kwargs)}</em></strong>'
+	__slots__ = ()
 
-	def emit_rtf(self, **kwargs) -> str:
-		return rf'{{\b \i {self.join_children("", "rtf", **kwargs)}}}'
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield '<strong><em>'
+		yield from self.iter_children('', 'html', **kwargs)
+		yield '</em></strong>'
 
-	def emit_latex(self, **kwargs) -> str:
-		return rf'\textit{{\textbf{{{self.join_children("", "latex", **kwargs)}}}}}'
+	def iter_rtf(self, **kwargs) -> Iterator[Fragment]:
+		yield r'{\b \i '
+		yield from self.iter_children('', 'rtf', **kwargs)
+		yield '}'
 
-	def emit_jd(self, **kwargs) -> str:
-		return f'***{self.join_children("", "jd", **kwargs)}***'
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield r'\textit{\textbf{'
+		yield from self.iter_children('', 'latex', **kwargs)
+		yield '}}'
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		yield '***'
+		yield from self.iter_children('', 'jd', **kwargs)
+		yield '***'
 
 
 class Strikethrough(Node):
-	def emit_html(self, **kwargs) -> str:
-		return f'<del>{self.join_children("", "html", **kwargs)}</del>'
+	__slots__ = ()
 
-	def emit_rtf(self, **kwargs) -> str:
-		body = self.join_children(r'\line ', 'rtf', **kwargs)
-		return rf'{{\strike {body}\par}}'
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield '<del>'
+		yield from self.iter_children('', 'html', **kwargs)
+		yield '</del>'
 
-	def emit_jd(self, **kwargs) -> str:
-		return f'~~{self.join_children("", "jd", **kwargs)}~~'
+	def iter_rtf(self, **kwargs) -> Iterator[Fragment]:
+		yield r'{\strike '
+		yield from self.iter_children(r'\line ', 'rtf', **kwargs)
+		yield r'\par}'
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		yield '~~'
+		yield from self.iter_children('', 'jd', **kwargs)
+		yield '~~'
 
 
 # MATH -------------------
 
 class MathInline(Node):
-	def emit_html(self, **kwargs) -> str:
-		return f'<span class="math">{self.join_children("", "html", **kwargs)}</span>'
+	__slots__ = ()
 
-	def emit_latex(self, **kwargs) -> str:
-		text = self.join_children("", "latex", **kwargs)
-		for regex, subst in latex_math_subst:
-			text = text.replace(regex, subst)
-		return f'${text}$'
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield '<span class="math">'
+		yield from self.iter_children('', 'html', **kwargs)
+		yield '</span>'
 
-	def emit_jd(self, **kwargs) -> str:
-		return f'«{self.join_children("", "jd", **kwargs)}»'
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield f'${self.join_children("", "latex", **kwargs).translate(latex_math_table)}$'
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		yield '«'
+		yield from self.iter_children('', 'jd', **kwargs)
+		yield '»'
 
 
 class Parenthesis(Node):
-	def emit_html(self, **kwargs) -> str:
-		return f'({self.join_children("", "html", **kwargs)})'
+	__slots__ = ()
 
-	def emit_mathml(self, **kwargs) -> str:
-		return f'<mfenced open="(" close=")"><mrow>{self.join_children("", "mathml", **kwargs)}</mrow></mfenced>'
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield '('
+		yield from self.iter_children('', 'html', **kwargs)
+		yield ')'
 
-	def emit_latex(self, **kwargs) -> str:
-		return f'({self.join_children("", "latex", **kwargs)})'
+	def iter_mathml(self, **kwargs) -> Iterator[Fragment]:
+		yield '<mfenced open="(" close=")"><mrow>'
+		yield from self.iter_children('', 'mathml', **kwargs)
+		yield '</mrow></mfenced>'
 
-	def emit_jd(self, **kwargs) -> str:
-		return f'({self.join_children("", "jd", **kwargs)})'
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield '('
+		yield from self.iter_children('', 'latex', **kwargs)
+		yield ')'
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		yield '('
+		yield from self.iter_children('', 'jd', **kwargs)
+		yield ')'
 
 
 class Braces(Node):
-	def emit_html(self, **kwargs) -> str:
-		return f'{{{self.join_children("", "html", **kwargs)}}}'
+	__slots__ = ()
 
-	def emit_latex(self, **kwargs) -> str:
-		return rf'\{{{self.join_children("", "latex", **kwargs)}\}}'
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield '{'
+		yield from self.iter_children('', 'html', **kwargs)
+		yield '}'
 
-	def emit_jd(self, **kwargs) -> str:
-		return f'{{{self.join_children("", "jd", **kwargs)}}}'
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield r'\{'
+		yield from self.iter_children('', 'latex', **kwargs)
+		yield r'\}'
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		yield '{'
+		yield from self.iter_children('', 'jd', **kwargs)
+		yield '}'
 
 
 class Brackets(Node):
-	def emit_html(self, **kwargs) -> str:
-		return self.join_children("", "html", **kwargs)
+	__slots__ = ()
 
-	def emit_mathml(self, **kwargs) -> str:
-		return self.join_children("", "mathml", **kwargs)
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		return self.iter_children('', 'html', **kwargs)
 
-	def emit_jd(self, **kwargs) -> str:
-		return f'[{self.join_children("", "jd", **kwargs)}]'
+	def iter_mathml(self, **kwargs) -> Iterator[Fragment]:
+		return self.iter_children('', 'mathml', **kwargs)
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		yield '['
+		yield from self.iter_children('', 'jd', **kwargs)
+		yield ']'
 
 
 class CapitalNotation(Node):
+	__slots__ = ()
+
 	def _capital_notation_parts(self, fmt: str, **kwargs):
-		lower = getattr(self.children[0], f'emit_{fmt}')(**kwargs)
-		upper = getattr(self.children[1], f'emit_{fmt}')(**kwargs)
-		terms = ''.join(getattr(i, f'emit_{fmt}')(**kwargs) for i in self.children[2:])
+		method = f'iter_{fmt}'
+		lower = getattr(self.children[0], method)(**kwargs)
+		upper = getattr(self.children[1], method)(**kwargs)
+		terms = iter_joined(self.children[2:], '', fmt, **kwargs)
 		return lower, upper, terms
 
 	def _get_tag(self) -> str:
-		return type(self).__name__.lower()
+		return self.__class__.__name__.lower()
 
-	def emit_html(self, **kwargs) -> str:
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
 		logging.warning(
-			f'Outputting MathML for {type(self).__name__} capital letter notation. MathML is not supported by Google Chrome.'
+			f'Outputting MathML for {self.__class__.__name__} capital letter notation. MathML is not supported by Google Chrome.'
 		)
-		return f'<math>{self.emit_mathml(**kwargs)}</math>'
+		yield '<math>'
+		yield self.iter_mathml(**kwargs)
+		yield '</math>'
 
-	def emit_mathml(self, **kwargs) -> str:
+	def iter_mathml(self, **kwargs) -> Iterator[Fragment]:
 		lower, upper, terms = self._capital_notation_parts('mathml', **kwargs)
-		return f'''
+		yield f'''
 			<mstyle displaystyle="true"><mrow>
 			<munderover>
 				<mo>&{self._get_tag()};</mo>
-				<mrow>{lower}</mrow><mrow>{upper}</mrow>
+				<mrow>'''
+		yield lower
+		yield '</mrow><mrow>'
+		yield upper
+		yield '''</mrow>
 			</munderover>
-			<mrow>{terms}</mrow>
+			<mrow>'''
+		yield terms
+		yield '''</mrow>
 			</mrow></mstyle>
 			'''
 
-	def emit_latex(self, **kwargs) -> str:
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
 		lower, upper, terms = self._capital_notation_parts('latex', **kwargs)
-		return rf'\displaystyle\{self._get_tag()}^{{{upper}}}_{{{lower}}} {terms}'
-
-	def emit_jd(self, **kwargs) -> str:
+		yield rf'\displaystyle\{self._get_tag()}^{{'
+		yield upper
+		yield '}_{'
+		yield lower
+		yield '} '
+		yield terms
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
 		lower, upper, terms = self._capital_notation_parts('jd', **kwargs)
-		return rf'{self._get_tag()}[{lower} {upper} {terms}]'
+		yield f'{self._get_tag()}['
+		yield lower
+		yield ' '
+		yield upper
+		yield ' '
+		yield terms
+		yield ']'
 
 
 class Sum(CapitalNotation):
-	pass
+	__slots__ = ()
 
 
 class Prod(CapitalNotation):
-	pass
+	__slots__ = ()
 
 
 class Int(CapitalNotation):
-	pass
+	__slots__ = ()
 
 
 class Sqrt(Node):
-	def emit_html(self, **kwargs) -> str:
-		return f'√<span style="border-top: 1px solid">{self.join_children("", "html", **kwargs)}</span>'
+	__slots__ = ()
 
-	def emit_mathml(self, **kwargs) -> str:
-		return f'<msqrt>{self.join_children("", "mathml", **kwargs)}</msqrt>'
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield '√<span style="border-top: 1px solid">'
+		yield from self.iter_children('', 'html', **kwargs)
+		yield '</span>'
 
-	def emit_latex(self, **kwargs) -> str:
-		return rf'\sqrt{{{self.join_children("", "latex", **kwargs)}}}'
+	def iter_mathml(self, **kwargs) -> Iterator[Fragment]:
+		yield '<msqrt>'
+		yield from self.iter_children('', 'mathml', **kwargs)
+		yield '</msqrt>'
 
-	def emit_jd(self, **kwargs) -> str:
-		return rf'sqrt[{self.join_children("", "jd", **kwargs)}]'
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield r'\sqrt{'
+		yield from self.iter_children('', 'latex', **kwargs)
+		yield '}'
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		yield 'sqrt['
+		yield from self.iter_children('', 'jd', **kwargs)
+		yield ']'
 
 
 # TODO: Properly nest Subscript and Superscript nodes, having both the base and "exponent"
 
 class SuperscriptBrackets(Node):
-	def emit_html(self, **kwargs) -> str:
-		return f'<sup>{self.join_children("", "html", **kwargs)}</sup>'
+	__slots__ = ()
 
-	def emit_mathml(self, **kwargs) -> str:
-		return f'<msup><msrow></msrow><msrow>{self.join_children("", "mathml", **kwargs)}</msrow></mssup>'
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield '<sup>'
+		yield from self.iter_children('', 'html', **kwargs)
+		yield '</sup>'
 
-	def emit_latex(self, **kwargs) -> str:
-		return f'^{self.join_children("", "latex", **kwargs)}'
+	def iter_mathml(self, **kwargs) -> Iterator[Fragment]:
+		yield '<msup><msrow></msrow><msrow>'
+		yield from self.iter_children('', 'mathml', **kwargs)
+		yield '</msrow></mssup>'
 
-	def emit_jd(self, **kwargs) -> str:
-		return f'^[{self.join_children("", "jd", **kwargs)}]'
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield '^'
+		yield from self.iter_children('', 'latex', **kwargs)
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		yield '^['
+		yield from self.iter_children('', 'jd', **kwargs)
+		yield ']'
 
 
 class SubscriptBrackets(Node):
-	def emit_html(self, **kwargs) -> str:
-		return f'<sub>{self.join_children("", "html", **kwargs)}</sub>'
+	__slots__ = ()
 
-	def emit_mathml(self, **kwargs) -> str:
-		return f'<msub><msrow></msrow><msrow>{self.join_children("", "mathml", **kwargs)}</msrow></mssub>'
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield '<sub>'
+		yield from self.iter_children('', 'html', **kwargs)
+		yield '</sub>'
 
-	def emit_latex(self, **kwargs) -> str:
-		return f'_{self.join_children("", "latex", **kwargs)}'
+	def iter_mathml(self, **kwargs) -> Iterator[Fragment]:
+		yield '<msub><msrow></msrow><msrow>'
+		yield from self.iter_children('', 'mathml', **kwargs)
+		yield '</msrow></mssub>'
 
-	def emit_jd(self, **kwargs) -> str:
-		return f'_[{self.join_children("", "jd", **kwargs)}]'
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield '_'
+		yield from self.iter_children('', 'latex', **kwargs)
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		yield '_['
+		yield from self.iter_children('', 'jd', **kwargs)
+		yield ']'
 
 
 class Subscript(TextNode):
-	def emit_html(self, **kwargs) -> str:
-		return f'<sub>{html.escape(self.text, quote=True)}</sub>'
+	__slots__ = ()
 
-	def emit_mathml(self, **kwargs) -> str:
-		return f'<msub><mrow></mrow><mrow>{html.escape(self.text, quote=True)}</mrow></mssub>'
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield f'<sub>{html.escape(self.text, quote=True)}</sub>'
 
-	def emit_latex(self, **kwargs) -> str:
-		return f'_{self.text}'
+	def iter_mathml(self, **kwargs) -> Iterator[Fragment]:
+		yield f'<msub><mrow></mrow><mrow>{html.escape(self.text, quote=True)}</mrow></mssub>'
 
-	def emit_jd(self, **kwargs) -> str:
-		return f'_{self.text}'
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield f'_{self.text}'
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		yield f'_{self.text}'
 
 
 class Superscript(TextNode):
-	def emit_html(self, **kwargs) -> str:
-		return f'<sup>{html.escape(self.text, quote=True)}</sup>'
+	__slots__ = ()
 
-	def emit_mathml(self, **kwargs) -> str:
-		return f'<msup><mrow></mrow><mrow>{html.escape(self.text, quote=True)}</mrow></mssup>'
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield f'<sup>{html.escape(self.text, quote=True)}</sup>'
 
-	def emit_latex(self, **kwargs) -> str:
-		return f'^{self.text}'
+	def iter_mathml(self, **kwargs) -> Iterator[Fragment]:
+		yield f'<msup><mrow></mrow><mrow>{html.escape(self.text, quote=True)}</mrow></mssup>'
 
-	def emit_jd(self, **kwargs) -> str:
-		return f'^{self.text}'
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield f'^{self.text}'
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		yield f'^{self.text}'
 
 
 class Identifier(TextNode):
-	def emit_html(self, **kwargs) -> str:
-		return f'<em>{html.escape(self.text, quote=True)}</em>'
+	__slots__ = ()
 
-	def emit_mathml(self, **kwargs) -> str:
-		return f'<mi>{self.text}</mi>'
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield f'<em>{html.escape(self.text, quote=True)}</em>'
+
+	def iter_mathml(self, **kwargs) -> Iterator[Fragment]:
+		yield f'<mi>{self.text}</mi>'
 
 
 class Operator(TextNode):
-	def emit_html(self, **kwargs) -> str:
-		return f' {html.escape(self.text, quote=True)} '
+	__slots__ = ()
 
-	def emit_mathml(self, **kwargs) -> str:
-		return f'<mo>{self.text}</mo>'
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield f' {html.escape(self.text, quote=True)} '
+
+	def iter_mathml(self, **kwargs) -> Iterator[Fragment]:
+		yield f'<mo>{self.text}</mo>'
 
 
 class Comment(TextNode):
-	def emit_html(self, **kwargs) -> str:
-		return f' {html.escape(self.text, quote=True)} '
+	__slots__ = ()
 
-	def emit_latex(self, **kwargs) -> str:
-		return rf' \text{{{self.text}}}'
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield f' {html.escape(self.text, quote=True)} '
 
-	def emit_jd(self, **kwargs) -> str:
-		return f' # {self.text} # '
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield rf' \text{{{self.text}}}'
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		yield f' # {self.text} # '
 
 
 class Number(TextNode):
-	def emit_mathml(self, **kwargs) -> str:
-		return f'<mn>{self.text}</mn>'
+	__slots__ = ()
+
+	def iter_mathml(self, **kwargs) -> Iterator[Fragment]:
+		yield f'<mn>{self.text}</mn>'
 
 
 class Newline(TextNode):
-	def emit_html(self, **kwargs) -> str:
-		return '<br>'
+	__slots__ = ()
 
-	def emit_latex(self, **kwargs) -> str:
-		return r'\\'
+	def iter_html(self, **kwargs) -> Iterator[Fragment]:
+		yield '<br>'
 
-	def emit_jd(self, **kwargs) -> str:
-		return '\n'
+	def iter_latex(self, **kwargs) -> Iterator[Fragment]:
+		yield r'\\'
+
+	def iter_jd(self, **kwargs) -> Iterator[Fragment]:
+		yield '\n'
@@ -0,0 +1,78 @@
+from collections import OrderedDict
+import typing
+
+
+class TocEntry(typing.NamedTuple):
+	"""
+	A heading in the table of contents of a Document
+	"""
+	level: int
+	ident: str  # Anchor of the heading, unique in its Document
+	heading: typing.Any  # The Heading Node
+
+
+class ParseContext:
+	"""
+	State of a single Document, gathered while parsing it and used while emitting it
+	"""
+	def __init__(self) -> None:
+		self.references = OrderedDict()  # References for citation mode
+		self.reference_numbers: typing.Dict[str, int] = {}  # Place of each reference in the list, starting at 1
+		self.html_ids: typing.Set[str] = set()  # Set of strings that are ids to certain html elements
+		self.anchor_counts: typing.Dict[str, int] = {}  # Underscores added to the last repeat of each base anchor
+		self.toc: typing.List[TocEntry] = []  # Headings, in order of appearance
+		self.finalized = False  # Whether the whole Document was parsed, so every reference is defined
+
+	def finalize(self) -> None:
+		"""
+		Marks the Document as completely parsed
+		"""
+		self.finalized = True
+
+	def cite(self, ref_key: str) -> None:
+		"""
+		Saves the place of a reference in the list of references, if it was not cited or defined before
+		"""
+		if ref_key not in self.references:
+			self.reference_numbers[ref_key] = len(self.references) + 1
+			self.references[ref_key] = None
+
+	def define_reference(self, ref_key: str, definition: typing.Tuple[typing.Any, str]) -> None:
+		"""
+		Saves the definition of a reference: its parsed Node and its source text
+		"""
+		self.cite(ref_key)
+		self.references[ref_key] = definition
+
+	def add_heading(self, level: int, heading: typing.Any) -> str:
+		"""
+		Adds a heading to the table of contents. Returns an anchor for it made from its text, unique in the Document.
+		Headings with the same text get underscores added to their anchor, one more for each
+		"""
+		return self._add_anchor(level, heading.anchor(self), heading)
+
+	def add_block(self, block: 'ParseContext') -> None:
+		"""
+		Adds the references and headings of a single Block, gathered in a context of its own, after the ones of the
+		Blocks before it
+		"""
+		for ref_key, definition in block.references.items():
+			if definition is None:
+				self.cite(ref_key)
+			else:
+				self.define_reference(ref_key, definition)
+		for level, _, heading in block.toc:
+			heading.ident = self.add_heading(level, heading)
+
+	def _add_anchor(self, level: int, base: str, heading: typing.Any) -> str:
+		# Shorter anchors with as many underscores are already taken, so they are not tried again
+		count = self.anchor_counts.get(base, 0)
+		ident = base + '_' * count
+		while ident in self.html_ids:
+			count += 1
+			ident = base + '_' * count
+		self.anchor_counts[base] = count
+		self.html_ids.add(ident)
+
+		self.toc.append(TocEntry(level, ident, heading))
+		return ident
@@ -0,0 +1,391 @@
+"""
+Flat representation of a syntax tree, stored in parallel arrays instead of one object per Node.
+"""
+from array import array
+import base64
+import binascii
+import json
+import sys
+import types
+import typing
+
+import jotdown.classes as classes
+from jotdown.classes import Node, TextNode
+
+# Every Node class, by the code it is stored with
+node_types: typing.List[typing.Type[Node]] = [
+	cls for cls in vars(classes).values() if isinstance(cls, type) and issubclass(cls, Node)
+]
+type_codes = {cls: code for code, cls in enumerate(node_types)}
+
+
+class _NodeRef(int):
+	"""
+	Index of a node stored as the value of an attribute of another one
+	"""
+	__slots__ = ()
+
+
+def _attribute_names(cls: typing.Type[Node]) -> typing.Tuple[str, ...]:
+	"""
+	Attributes of a Node class other than its children and text, which are stored in the arrays
+	"""
+	names = []
+	for base in reversed(cls.__mro__):
+		names.extend(i for i in vars(base).get('__slots__', ()) if i not in ('children', 'text'))
+	return tuple(names)
+
+
+attribute_names = {cls: _attribute_names(cls) for cls in node_types}
+_text_types = {cls for cls in node_types if issubclass(cls, TextNode)}
+attribute_positions = {cls: {name: n for n, name in enumerate(names)} for cls, names in attribute_names.items()}
+
+
+class FlatTree:
+	"""
+	A syntax tree stored as parallel arrays, indexed by node in document order: the code of each node's type,
+	the indices of its parent, first child and next sibling, and the range of the text under it in one string
+	shared by the whole tree. Other attributes, like the level of a Heading, are only kept for nodes that have them,
+	as a tuple in the order of attribute_names.
+	Nodes that are attributes of others but not their children, like the caption of a Table, are stored after the
+	children of their owner, with it as their parent, but are not its children.
+
+	FlatNode views let the tree be used like the Node tree it was made from, emitters included
+	"""
+	def __init__(self) -> None:
+		self.types = bytearray()
+		self.parents = array('i')
+		self.first_child = array('i')
+		self.next_sibling = array('i')
+		self.text_start = array('I')
+		self.text_end = array('I')
+		self.attributes: typing.Dict[int, typing.Tuple] = {}
+		self.text = ''
+
+		# Only needed while the tree is built
+		self._last_child = array('i')
+		self._texts: typing.List[str] = []
+		self._text_size = 0
+
+	def __len__(self) -> int:
+		return len(self.types)
+
+	@property
+	def root(self) -> 'FlatNode':
+		return FlatNode(self, 0)
+
+	def node(self, index: int) -> 'FlatNode':
+		return FlatNode(self, index)
+
+	def child_indices(self, index: int) -> typing.Iterator[int]:
+		child = self.first_child[index]
+		while child >= 0:
+			yield child
+			child = self.next_sibling[child]
+
+	def node_type(self, index: int) -> typing.Type[Node]:
+		return node_types[self.types[index]]
+
+	def text_of(self, index: int) -> str:
+		"""
+		All text under a node, including the text of nodes stored as its attributes
+		"""
+		return self.text[self.text_start[index]:self.text_end[index]]
+
+	def indices_of(self, node_type: typing.Type[Node]) -> typing.Iterator[int]:
+		"""
+		Indices of every node of exactly node_type, in document order
+		"""
+		code = type_codes[node_type]
+		index = self.types.find(code)
+		while index >= 0:
+			yield index
+			index = self.types.find(code, index + 1)
+
+	def headings(self) -> typing.Iterator[typing.Tuple[int, str, str]]:
+		"""
+		Yields the level, anchor and text of every heading, in document order
+		"""
+		positions = attribute_positions[classes.Heading]
+		level, ident = positions['level'], positions['ident']
+		for index in self.indices_of(classes.Heading):
+			attributes = self.attributes[index]
+			yield attributes[level], attributes[ident], self.text_of(index)
+
+	def add(self, node: Node, parent: int=-1, children: typing.Iterable[Node]=None) -> int:
+		"""
+		Copies node and its descendants into the tree, as the last child of parent. Its children are taken from
+		children instead, if given, so that each one can be dropped as soon as it is copied
+		"""
+		if children is None:
+			return self._add_subtree(node, parent)
+
+		index = self._append(node, parent, False)
+		self._resolve_attributes(index, {})
+		for child in children:
+			self._add_subtree(child, index)
+		self.text_end[index] = self._text_size
+		return index
+
+	def roots(self) -> typing.Iterator[int]:
+		"""
+		Indices of the nodes added without a parent, each followed by the nodes under it
+		"""
+		index = 0
+		while index < len(self.parents):
+			yield index
+			try:
+				index = self.parents.index(-1, index + 1)
+			except ValueError:
+				return
+
+	def unflatten(self, index: int=0) -> Node:
+		"""
+		Returns new Nodes for the node at index, added without a parent, and every node under it
+		"""
+		try:
+			end = self.parents.index(-1, index + 1)
+		except ValueError:
+			end = len(self.types)
+
+		nodes = []
+		append = nodes.append
+		text, text_start, text_end = self.text, self.text_start, self.text_end
+		no_children = classes.no_children
+		for i in range(index, end):
+			cls = node_types[self.types[i]]
+			node = cls.__new__(cls)
+			if cls in _text_types:
+				node.children = no_children
+				node.text = text[text_start[i]:text_end[i]]
+			else:
+				node.children = []
+			append(node)
+
+		first_child, next_sibling = self.first_child, self.next_sibling
+		for i in range(index, end):
+			child = first_child[i]
+			if child >= 0:
+				append = nodes[i - index].children.append
+				while child >= 0:
+					append(nodes[child - index])
+					child = next_sibling[child]
+
+		for i, attributes in self.attributes.items():
+			if not index <= i < end:
+				continue
+			node = nodes[i - index]
+			for name, value in zip(attribute_names[node.__class__], attributes):
+				if isinstance(value, _NodeRef):
+					value = nodes[value - index]
+				elif isinstance(value, list) and value and isinstance(value[0], _NodeRef):
+					value = [nodes[j - index] for j in value]
+				setattr(node, name, value)
+		return nodes[0]
+
+	def dumps(self) -> str:
+		"""
+		Serializes the tree as JSON. Only data is stored, so it can be loaded from files that are not trusted
+		"""
+		def value(i: typing.Any) -> typing.List:
+			if isinstance(i, _NodeRef):
+				return ['node', int(i)]
+			if isinstance(i, list) and i and isinstance(i[0], _NodeRef):
+				return ['nodes', [int(j) for j in i]]
+			return ['value', i]
+
+		return json.dumps({
+			'byteorder': sys.byteorder,
+			'types': base64.b64encode(self.types).decode('ascii'),
+			**{name: base64.b64encode(getattr(self, name).tobytes()).decode('ascii') for name in _array_names},
+			'text': self.text,
+			'attributes': [[index, [value(i) for i in attributes]] for index, attributes in self.attributes.items()],
+		}, ensure_ascii=False)
+
+	@classmethod
+	def loads(cls, data: str) -> 'FlatTree':
+		"""
+		Loads a tree serialized by dumps. Raises ValueError if it is not valid
+		"""
+		try:
+			fields = json.loads(data)
+			if fields['byteorder'] != sys.byteorder:
+				raise ValueError('Tree stored with another byte order')
+
+			tree = cls()
+			tree.types = bytearray(base64.b64decode(fields['types']))
+			for name in _array_names:
+				getattr(tree, name).frombytes(base64.b64decode(fields[name]))
+			tree.text = fields['text']
+
+			size = len(tree.types)
+			if any(len(getattr(tree, name)) != size for name in _array_names) or max(tree.types, default=0) >= len(node_types):
+				raise ValueError('Tree arrays do not match')
+			for index, attributes in fields['attributes']:
+				values = []
+				for kind, value in attributes:
+					if kind == 'node':
+						value = _NodeRef(value)
+					elif kind == 'nodes':
+						value = [_NodeRef(i) for i in value]
+					values.append(value)
+				tree.attributes[index] = tuple(values)
+		except (KeyError, TypeError, IndexError, AttributeError, json.JSONDecodeError, binascii.Error) as e:
+			raise ValueError(f'Not a serialized tree: {e}') from e
+		return tree
+
+	def finish(self) -> 'FlatTree':
+		"""
+		Joins the text of the tree once every node is added
+		"""
+		self.text += ''.join(self._texts)
+		self._texts = []
+		self._last_child = array('i')
+		return self
+
+	def _add_subtree(self, node: Node, parent: int) -> int:
+		# Walk the subtree with an explicit stack, adding nodes in document order. None marks the end of a subtree
+		added = {}  # Index of every node added, by id
+		root = -1
+		stack = [(node, parent, False)]
+		while stack:
+			node, parent, detached = stack.pop()
+			if node is None:
+				self.text_end[parent] = self._text_size
+				continue
+
+			index = self._append(node, parent, detached)
+			added[id(node)] = index
+			if root < 0:
+				root = index
+
+			stack.append((None, index, False))
+			children = node.children
+			child_ids = {id(i) for i in children}
+			detached = [i for i in self._attribute_nodes(index) if id(i) not in child_ids]
+			stack.extend((i, index, True) for i in reversed(detached))
+			stack.extend((child, index, False) for child in reversed(children))
+
+		for index in range(root, len(self.types)):
+			self._resolve_attributes(index, added)
+		return root
+
+	def _append(self, node: Node, parent: int, detached: bool) -> int:
+		index = len(self.types)
+		self.types.append(type_codes[type(node)])
+		self.parents.append(parent)
+		self.first_child.append(-1)
+		self.next_sibling.append(-1)
+		self._last_child.append(-1)
+		if parent >= 0 and not detached:
+			last = self._last_child[parent]
+			if last < 0:
+				self.first_child[parent] = index
+			else:
+				self.next_sibling[last] = index
+			self._last_child[parent] = index
+
+		self.text_start.append(self._text_size)
+		if isinstance(node, TextNode):
+			self._texts.append(node.text)
+			self._text_size += len(node.text)
+		self.text_end.append(self._text_size)
+
+		names = attribute_names[type(node)]
+		if names:
+			self.attributes[index] = tuple(getattr(node, i) for i in names)
+		return index
+
+	def _attribute_nodes(self, index: int) -> typing.List[Node]:
+		nodes = []
+		for value in self.attributes.get(index, ()):
+			for i in value if isinstance(value, (list, tuple)) else (value,):
+				if isinstance(i, Node):
+					nodes.append(i)
+		return nodes
+
+	def _resolve_attributes(self, index: int, added: typing.Dict[int, int]) -> None:
+		"""
+		Replaces the nodes in the attributes of a node with their indices
+		"""
+		attributes = self.attributes.get(index)
+		if not attributes or not any(isinstance(i, (Node, list, tuple)) for i in attributes):
+			return
+		resolved = []
+		for value in attributes:
+			if isinstance(value, Node):
+				value = _NodeRef(added[id(value)])
+			elif isinstance(value, (list, tuple)) and any(isinstance(i, Node) for i in value):
+				value = [_NodeRef(added[id(i)]) for i in value]
+			resolved.append(value)
+		self.attributes[index] = tuple(resolved)
+
+	def _value(self, value: typing.Any) -> typing.Any:
+		if isinstance(value, _NodeRef):
+			return FlatNode(self, value)
+		if isinstance(value, list) and value and isinstance(value[0], _NodeRef):
+			return [FlatNode(self, i) for i in value]
+		return value
+
+
+# Arrays of a FlatTree other than the types of its nodes, which is a bytearray
+_array_names = ('parents', 'first_child', 'next_sibling', 'text_start', 'text_end')
+
+
+class FlatNode:
+	"""
+	View of a node of a FlatTree that stands in for the Node it was made from. Its children, text and other attributes
+	are read from the tree when they are needed, and the methods of its Node class, emitters included, work on it
+	"""
+	__slots__ = ('tree', 'index')
+
+	def __init__(self, tree: FlatTree, index: int) -> None:
+		object.__setattr__(self, 'tree', tree)
+		object.__setattr__(self, 'index', index)
+
+	@property
+	def __class__(self) -> typing.Type[Node]:
+		# So that isinstance works as it would for the Node
+		return self.tree.node_type(self.index)
+
+	@property
+	def children(self) -> typing.List['FlatNode']:
+		return [FlatNode(self.tree, i) for i in self.tree.child_indices(self.index)]
+
+	@property
+	def text(self) -> str:
+		if not issubclass(self.__class__, TextNode):
+			raise AttributeError(f'{self.__class__.__name__} has no text')
+		return self.tree.text_of(self.index)
+
+	def __getattr__(self, name: str) -> typing.Any:
+		position = attribute_positions[self.__class__].get(name)
+		if position is not None:
+			return self.tree._value(self.tree.attributes[self.index][position])
+
+		value = getattr(self.__class__, name)
+		if isinstance(value, types.MemberDescriptorType):
+			raise AttributeError(name)
+		if isinstance(value, types.FunctionType):
+			return types.MethodType(value, self)
+		return value
+
+	def __setattr__(self, name: str, value: typing.Any) -> None:
+		position = attribute_positions[self.__class__].get(name)
+		if position is None:
+			raise AttributeError(f'{self.__class__.__name__} has no attribute {name} that can be set')
+		attributes = list(self.tree.attributes[self.index])
+		attributes[position] = value
+		self.tree.attributes[self.index] = tuple(attributes)
+
+	def __repr__(self) -> str:
+		return f'<{self.__class__.__name__} {self.index} of {self.tree!r}>'
+
+
+def flatten(root: Node, children: typing.Iterable[Node]=None) -> FlatTree:
+	"""
+	Returns a FlatTree copied from root. If given, children are used as the children of root instead of its own
+	"""
+	tree = FlatTree()
+	tree.add(root, children=children)
+	return tree.finish()
@@ -1,15 +1,14 @@
+import codecs
+import functools
+import locale
 import logging
 import os
-from collections import OrderedDict
 import re
 import mimetypes
 import typing
 
 from jotdown.errors import EncodingException
 
-references = OrderedDict()  # References for citation mode
-html_document_ids = set()  # Set of strings that are ids to certain html elements
-
 re_flags = re.UNICODE
 
 # Custom types for clearer type hinting
@@ -65,91 +64,223 @@ def ext_translation(url: str, fformat: str) -> str:
 		return url
 
 
-def rtf_escape_unicode(string: str) -> str:
-	res = []
-	for char in string:
-		cp = ord(char)
-		if cp < 128 and char not in r'\{}':
-			res.append(char)
+class _RtfEscapes(dict):
+	"""
+	Translation table from codepoints to their RTF escapes, filled in as characters are found
+	"""
+	def __missing__(self, cp: int) -> str:
+		if cp < 128 and chr(cp) not in '\\{}':
+			escaped = chr(cp)
 		elif cp < 256:
 			# \'xy syntax, with xy as a hex number
-			res.extend(r"\'%02x" % cp)
-		elif cp < 32768:
-			# \uN? syntax, with N as a decimal
-			res.extend(r'\uc1\u%d?' % cp)
+			escaped = r"\'%02x" % cp
 		elif cp < 65536:
-			# \uN? syntax, with N as a decimal, negative number
-			res.extend(r'\uc1\u%d?' % (cp - 65536))
+			# \uN? syntax, with N as a signed 16-bit decimal
+			escaped = r'\uc1\u%d?' % _signed_16(cp)
 		else:
-			raise EncodingException(
-				'Document contains characters with Unicode codepoints greater that 65536, not supported by RTF'
-			)
-	return ''.join(res)
+			# Outside the Basic Multilingual Plane, as an UTF-16 surrogate pair
+			offset = cp - 0x10000
+			escaped = r'\uc1\u%d?\u%d?' % (_signed_16(0xd800 + (offset >> 10)), _signed_16(0xdc00 + (offset & 0x3ff)))
+		self[cp] = escaped
+		return escaped
+
+
+def _signed_16(n: int) -> int:
+	return n - 65536 if n >= 32768 else n
+
+
+_rtf_escapes = _RtfEscapes()
+
+
+def rtf_escape_unicode(string: str) -> str:
+	if string.isascii():
+		# Only backslashes and braces need escaping, replaced in bulk. Backslashes go first, as the others add them
+		return string.replace('\\', r"\'5c").replace('{', r"\'7b").replace('}', r"\'7d")
+	return string.translate(_rtf_escapes)
+
+
+# Encodings tried in order when a file's encoding is not known, with None as the system's default
+guessed_encodings = ('utf-8', 'cp1252', 'mac_roman', None)
+
+# How much of a file is used to detect its encoding
+encoding_probe_size = 1 << 16
+
+byte_order_marks = (
+	# Longest first, as the UTF-32 LE mark starts with the UTF-16 LE one
+	(codecs.BOM_UTF32_BE, 'utf-32'),
+	(codecs.BOM_UTF32_LE, 'utf-32'),
+	(codecs.BOM_UTF8, 'utf-8-sig'),
+	(codecs.BOM_UTF16_BE, 'utf-16'),
+	(codecs.BOM_UTF16_LE, 'utf-16'),
+)
+
+# Encoding detected by chardet for a file in each directory, used for its siblings if it decodes them
+directory_encodings = {}
 
 
 def read_with_encoding(path: str) -> str:
 	"""
 	Returns the contents of a file of unknown encoding, hopefully.
 	"""
-	# TODO: Avoid having to read the whole file into memory
+	with open(path, 'rb') as f:
+		raw_data = f.read()
+
+	for encoding in _detect_encodings(path, raw_data, whole=True):
+		try:
+			text = str(raw_data, encoding=encoding)
+		except UnicodeDecodeError:
+			continue
+		return text.replace('\r\n', '\n').replace('\r', '\n')  # Universal newlines, like open()
+
+	raise EncodingException(f'Could not open {path}, unknown encoding')
+
+
+def read_lines_with_encoding(path: str) -> typing.Iterator[str]:
+	"""
+	Yields the lines of a file of unknown encoding, each one ending in a newline, without reading the whole file into
+	memory. Lines are split like str.split('\\n') after universal newline translation, so a file ending in a newline
+	yields an empty last line.
+	The encoding is detected from the start of the file. If a guessed encoding fails to decode a later line, the
+	rest of the file is decoded with the next guess that works
+	"""
+	with open(path, 'rb') as f:
+		head = f.read(encoding_probe_size)
+		encodings = _detect_encodings(path, head, whole=len(head) < encoding_probe_size)
+
+		if not _is_ascii_compatible(encodings[0]):
+			f.close()
+			yield from _text_lines(path, encodings[0])
+			return
+
+		f.seek(0)
+		encoding = encodings.pop(0)
+		decoder = codecs.getincrementaldecoder(encoding)()
+		last = '\n'
+		line_number = 0
+		for line_number, raw_line in enumerate(f, 1):
+			while True:
+				try:
+					line = decoder.decode(raw_line, final=True)
+					break
+				except UnicodeDecodeError:
+					if not encodings:
+						raise EncodingException(f'Could not open {path}, unknown encoding')
+					logging.info(f'Line {line_number} of {path} is not {encoding}, reading the rest with {encodings[0]}')
+					encoding = encodings.pop(0)
+					decoder = codecs.getincrementaldecoder(encoding)()
+
+			# Universal newlines
+			if '\r' in line:
+				line = line.replace('\r\n', '\n').replace('\r', '\n')
+				*lines, last = line.split('\n')
+				for i in lines:
+					yield i + '\n'
+				if last:
+					yield last + '\n'
+			else:
+				last = line
+				yield line if line[-1:] == '\n' else line + '\n'
 
+		if last[-1:] in ('\n', ''):
+			yield '\n'
+
+
+def _detect_encodings(path: str, head: bytes, whole: bool) -> typing.List[str]:
+	"""
+	Returns the likely encoding of a file from its first bytes (or all of them, if whole), followed by other
+	encodings to fall back to
+	"""
 	fname, ext = os.path.splitext(path)
-	encoding = None
 
 	# Known encodings
 	if ext in known_encodings:
-		encoding = known_encodings[ext]
-		logging.info(f'Reading {path} with known encoding {encoding}')
+		logging.info(f'Reading {path} with known encoding {known_encodings[ext]}')
+		return [known_encodings[ext]]
 
 	# Encoding could be explicitly announced in the file
 	elif ext in explicit_encodings:
-		with open(path, 'rb') as f:
-			head = f.read(1024)
-		m = explicit_encodings[ext].match(head)
+		m = explicit_encodings[ext].match(head[:1024])
 		if m:
 			encoding = str(m.group(1), encoding='ascii')
 			logging.info(f'Reading {path} with explicit encoding {encoding}')
+			return [encoding]
+
+	for bom, encoding in byte_order_marks:
+		if head.startswith(bom):
+			logging.info(f'Reading {path} with byte order marked encoding {encoding}')
+			return [encoding]
 
-	if encoding:
-		with open(path, encoding=encoding) as f:
-			return f.read()
+	encodings = [i or locale.getpreferredencoding(False) for i in guessed_encodings]
 
-	# If chardet is installed, use it
+	# If chardet is installed, use it, unless the encoding of a sibling file works. Fall back to guessing
 	try:
 		from chardet import detect
 	except ImportError:
 		pass
 	else:
-		with open(path, 'rb') as f:
-			raw_data = f.read()
-			guessed_encoding = detect(raw_data)['encoding']
+		directory = os.path.dirname(os.path.abspath(path))
+		sibling_encoding = directory_encodings.get(directory)
+		if sibling_encoding and _reuses_encoding(head, sibling_encoding, whole):
+			logging.info(f'Reading {path} with the encoding of its siblings {sibling_encoding}')
+			return [sibling_encoding] + encodings
+
+		guessed_encoding = detect(head[:encoding_probe_size])['encoding']
+		if guessed_encoding:
 			logging.info(f'Reading {path} with chardet\'d encoding {guessed_encoding}')
-			return str(raw_data, encoding=guessed_encoding)
+			directory_encodings[directory] = guessed_encoding
+			return [guessed_encoding] + encodings
+
 	# Guess
-	try:
-		with open(path, encoding='utf-8') as f:  # Is it a sane system?
-			logging.info(f'Trying to read {path} with utf-8')
-			return f.read()
-	except UnicodeDecodeError:
-		pass
+	while len(encodings) > 1 and not _decodes(head, encodings[0], whole):
+		encodings.pop(0)
+	logging.info(f'Trying to read {path} with {encodings[0]}')
+	return encodings
 
-	try:
-		with open(path, encoding='cp1252') as f:  # Is it Windows?
-			logging.info(f'Trying to read {path} with cp1252')
-			return f.read()
-	except UnicodeDecodeError:
-		pass
 
-	try:
-		with open(path, encoding='mac_roman') as f:  # Is it Mac?
-			logging.info(f'Trying to read {path} with mac_roman')
-			return f.read()
-	except UnicodeDecodeError:
-		pass
+def _reuses_encoding(data: bytes, encoding: str, whole: bool) -> bool:
+	"""
+	Whether data, the start of a file if not whole, can be read with the encoding of a sibling file. Only encodings
+	that reject some text are trusted, as any text decodes in encodings like latin-1, if wrongly. Text that is valid
+	UTF-8, other than ASCII, is not read in any other encoding
+	"""
+	if not _rejects_text(encoding) or not _decodes(data, encoding, whole):
+		return False
+	if codecs.lookup(encoding).name == 'utf-8' or data.isascii():
+		return True
+	return not _decodes(data, 'utf-8', whole)
+
 
+@functools.lru_cache()
+def _rejects_text(encoding: str) -> bool:
+	"""
+	Whether most non-ASCII bytes are invalid on their own in encoding, so it fails to decode most text in other ones
+	"""
+	decoded = sum(_decodes(bytes([i]), encoding, True) for i in range(0x80, 0x100))
+	return decoded < 0x60
+
+
+def _decodes(data: bytes, encoding: str, whole: bool) -> bool:
+	"""
+	Whether data, or the start of a longer text if not whole, is valid in encoding
+	"""
 	try:
-		with open(path) as f:  # Try default encoding
-			logging.info(f'Trying to read {path} with your system\'s default encoding. Godspeed.')
-			return f.read()
+		codecs.getincrementaldecoder(encoding)().decode(data, final=whole)
+		return True
 	except UnicodeDecodeError:
-		raise EncodingException(f'Could not open {path}, unknown encoding')
+		return False
+
+
+def _is_ascii_compatible(encoding: str) -> bool:
+	"""
+	Whether newlines are encoded as a single b'\\n' byte, so the file can be split into lines before decoding
+	"""
+	return '\n'.encode(encoding) == b'\n'
+
+
+def _text_lines(path: str, encoding: str) -> typing.Iterator[str]:
+	with open(path, encoding=encoding) as f:
+		last = '\n'
+		for last in f:
+			yield last if last[-1:] == '\n' else last + '\n'
+		if last[-1:] == '\n':
+			yield '\n'
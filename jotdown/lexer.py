@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 import string
+from enum import IntEnum, auto
 from re import sub, compile, match, VERBOSE
-from typing import Iterable, Iterator, Generator, Tuple, Match, Optional, Union
+from typing import Iterable, Iterator, Generator, Tuple, Match, Optional, Union, List, Dict, Pattern, NamedTuple, Any
 
 from jotdown.roman import from_roman, InvalidRomanNumeralError
 from jotdown.regex import *
@@ -21,24 +22,77 @@ re_code_open = compile(r'^```([\w\d+#][\w\d+#\s]*)$', flags=re_flags)
 re_math_open = compile(r'^«««\s*$', flags=re_flags)
 re_math_close = compile(r'^»»»\s*$', flags=re_flags)
 
+
+class TextToken(IntEnum):
+	"""
+	Types of the tokens yielded by get_text_tokens
+	"""
+	CodeInline_AMB = auto()
+	StrongEmph_A_AMB = auto()
+	StrongEmph_B_AMB = auto()
+	Strong_A_AMB = auto()
+	Strong_B_AMB = auto()
+	Emph_A_AMB = auto()
+	Emph_B_AMB = auto()
+	Strikethrough_AMB = auto()
+	MathInline_OPEN = auto()
+	MathInline_CLOSE = auto()
+	Image = auto()
+	ImplicitLink = auto()
+	Link = auto()
+	ReferenceLink = auto()
+	ReferenceDef = auto()
+	ImplicitEmail = auto()
+	Plaintext = auto()
+	Math = auto()  # The contents of inline math, not parsed as text
+
+
+class MathToken(IntEnum):
+	"""
+	Types of the tokens yielded by get_math_tokens
+	"""
+	Math_OPEN = auto()  # The root of every math expression, never yielded
+	SuperscriptBrackets_OPEN = auto()
+	SubscriptBrackets_OPEN = auto()
+	Sum_OPEN = auto()
+	Prod_OPEN = auto()
+	Int_OPEN = auto()
+	Sqrt_OPEN = auto()
+	Parenthesis_OPEN = auto()
+	Parenthesis_CLOSE = auto()
+	Braces_OPEN = auto()
+	Braces_CLOSE = auto()
+	Brackets_OPEN = auto()
+	Brackets_CLOSE = auto()
+	Comment = auto()
+	Subscript = auto()
+	Superscript = auto()
+	Number = auto()
+	Operator = auto()
+	Identifier = auto()
+	Whitespace = auto()
+	Newline = auto()
+
+
 # Token definitions for text parsing
 
 text_tokens = [
-	(r'`', 'CodeInline_AMB'),
+	(r'`', TextToken.CodeInline_AMB),
 
-	(r'\*\*\*', 'StrongEmph_A_AMB'),
-	(r'\b___', 'StrongEmph_B_AMB'),
+	# Tokens are matched at the start of the remaining text, where a leading \b before '_' always holds
+	(r'\*\*\*', TextToken.StrongEmph_A_AMB),
+	(r'___', TextToken.StrongEmph_B_AMB),
 
-	(r'\*\*', 'Strong_A_AMB'),
-	(r'\b__', 'Strong_B_AMB'),
+	(r'\*\*', TextToken.Strong_A_AMB),
+	(r'__', TextToken.Strong_B_AMB),
 
-	(r'\*', 'Emph_A_AMB'),
-	(r'\b_', 'Emph_B_AMB'),
+	(r'\*', TextToken.Emph_A_AMB),
+	(r'_', TextToken.Emph_B_AMB),
 
-	(r'~~', 'Strikethrough_AMB'),
+	(r'~~', TextToken.Strikethrough_AMB),
 
-	(r'«', 'MathInline_OPEN'),
-	(r'»', 'MathInline_CLOSE'),
+	(r'«', TextToken.MathInline_OPEN),
+	(r'»', TextToken.MathInline_CLOSE),
 
 	(r'''
 		!
@@ -50,65 +104,108 @@ text_tokens = [
 				"([^"]*)"\s*  # Quoted string with optional trailing space: the title text
 			)?  # Non-capturing group is optional
 		\)
-	''', 'Image'),
+	''', TextToken.Image),
 	# TODO: Support links from other protocols
-	(r'(https?://\S+)', 'ImplicitLink'),
-	(r'\[([^\]]*)\]\(([^\)]*)\)', 'Link'),
+	(r'(https?://\S+)', TextToken.ImplicitLink),
+	(r'\[([^\]]*)\]\(([^\)]*)\)', TextToken.Link),
 
-	(r'\[([^\]]*)\]\[([^\]]*)\]', 'ReferenceLink'),
-	(r'\[([^\]]*)\]:\s*(.*)\n', 'ReferenceDef'),
+	(r'\[([^\]]*)\]\[([^\]]*)\]', TextToken.ReferenceLink),
+	(r'\[([^\]]*)\]:\s*(.*)\n', TextToken.ReferenceDef),
 
-	(r'(\S+@\S+\.\S+)', 'ImplicitEmail'),
+	(r'(\S+@\S+\.\S+)', TextToken.ImplicitEmail),
 
-	(r'(\s*(?:[^\s_\*`«»~]|~(?!~)|\\[^_\*`«»~]|(?<=[^\W_])_(?=[^\W_]))*\s*)', 'Plaintext')
+	(r'(\s*(?:[^\s_\*`«»~]|~(?!~)|\\[^_\*`«»~]|(?<=[^\W_])_(?=[^\W_]))*\s*)', TextToken.Plaintext)
 
 ]
 
 math_tokens = [
-	(r'(\^\[)', "SuperscriptBrackets_OPEN"),
-	(r'(_\[)', "SubscriptBrackets_OPEN"),
-	(r'(sum\[)', "Sum_OPEN"),
-	(r'(prod\[)', "Prod_OPEN"),
-	(r'(int\[)', "Int_OPEN"),
-	(r'(sqrt\[)', "Sqrt_OPEN"),
-	(r'(\()', "Parenthesis_OPEN"),
-	(r'(\))', "Parenthesis_CLOSE"),
-	(r'({)', "Braces_OPEN"),
-	(r'(})', "Braces_CLOSE"),
-	(r'(\[)', "Brackets_OPEN"),  # Brackets are for grouping that won't show up in output
-	(r'(\])', "Brackets_CLOSE"),
-
-	(r'#\s*([^#\n]*)(?:#|(?=\n)|$)', 'Comment'),
-	(r'_([%(num)s]+|[^%(not_id)s]+)' % math_exp, 'Subscript'),
-	(r'\^([%(num)s]+|[^%(not_id)s]+|\*|∁|)' % math_exp, 'Superscript'),
-	(r'([+−]?[%(num)s][%(num)s\.]*)' % math_exp, 'Number'),
-	(r'([%(op)s])' % math_exp, 'Operator'),
+	(r'(\^\[)', MathToken.SuperscriptBrackets_OPEN),
+	(r'(_\[)', MathToken.SubscriptBrackets_OPEN),
+	(r'(sum\[)', MathToken.Sum_OPEN),
+	(r'(prod\[)', MathToken.Prod_OPEN),
+	(r'(int\[)', MathToken.Int_OPEN),
+	(r'(sqrt\[)', MathToken.Sqrt_OPEN),
+	(r'(\()', MathToken.Parenthesis_OPEN),
+	(r'(\))', MathToken.Parenthesis_CLOSE),
+	(r'({)', MathToken.Braces_OPEN),
+	(r'(})', MathToken.Braces_CLOSE),
+	(r'(\[)', MathToken.Brackets_OPEN),  # Brackets are for grouping that won't show up in output
+	(r'(\])', MathToken.Brackets_CLOSE),
+
+	(r'#\s*([^#\n]*)(?:#|(?=\n)|$)', MathToken.Comment),
+	(r'_([%(num)s]+|[^%(not_id)s]+)' % math_exp, MathToken.Subscript),
+	(r'\^([%(num)s]+|[^%(not_id)s]+|\*|∁|)' % math_exp, MathToken.Superscript),
+	(r'([+−]?[%(num)s][%(num)s\.]*)' % math_exp, MathToken.Number),
+	(r'([%(op)s])' % math_exp, MathToken.Operator),
 	# (r'([^_\^%(op)]*)\s*', 'Plaintext'),
-	(r'([+−]?[^%(not_id)s]+)' % math_exp, 'Identifier'),
-	(r'([^\S\n]+)', 'Whitespace'),
-	(r'(\n)', 'Newline')
+	(r'([+−]?[^%(not_id)s]+)' % math_exp, MathToken.Identifier),
+	(r'([^\S\n]+)', MathToken.Whitespace),
+	(r'(\n)', MathToken.Newline)
 ]
 
 bracket_closable = ["SubscriptBrackets", "SuperscriptBrackets", "Sum", "Prod", "Int", "Sqrt"]
 
 # Tokens that disable text parsing : Until this is encountered, yield this token
 disabling_tokens = {
-	'CodeInline_AMB': ('`', 'Plaintext', 'CodeInline_AMB'),
-	'MathInline_OPEN': ('»', 'Math', 'MathInline_CLOSE')
+	TextToken.CodeInline_AMB: ('`', TextToken.Plaintext, TextToken.CodeInline_AMB),
+	TextToken.MathInline_OPEN: ('»', TextToken.Math, TextToken.MathInline_CLOSE)
 }
 
-text_tokens = [(compile(exp, flags=re_flags | VERBOSE), val) for (exp, val) in text_tokens]
-math_tokens = [(compile(exp, flags=re_flags), val) for (exp, val) in math_tokens]
 
+def compile_scanner(
+		tokens: List[Tuple[str, IntEnum]],
+		flags: int
+) -> Tuple[Pattern, List[Optional[Tuple[IntEnum, int, int]]]]:
+	"""
+	Combines (regex, token) pairs into a single alternation of named groups, tried in the given order.
+	Returns the compiled pattern and, indexed by match.lastindex, the token matched and the slice of match.groups()
+	holding its own groups
+	"""
+	alternatives = []
+	token_groups = [None]
+	for exp, token in tokens:
+		n_groups = compile(exp, flags=flags).groups
+		start = len(token_groups)
+		token_groups.append((token, start, start + n_groups))
+		token_groups.extend([None] * n_groups)
+		# The newline keeps comments in VERBOSE expressions from swallowing the closing parenthesis
+		alternatives.append(f'(?P<{token.name}>{exp}\n)' if flags & VERBOSE else f'(?P<{token.name}>{exp})')
+	return compile('|'.join(alternatives), flags=flags), token_groups
+
+
+text_scanner, text_token_groups = compile_scanner(text_tokens, re_flags | VERBOSE)
+math_scanner, math_token_groups = compile_scanner(math_tokens, re_flags)
+
+# Read up until the enabling char is found
+disabled_scanners = {val: compile(rf'([^{char}]*){char}', flags=re_flags) for val, (char, _, _) in disabling_tokens.items()}
 
-def get_blocks(file: Iterable) -> Iterator[Tuple[int, Block]]:
+
+class LexedBlock(NamedTuple):
+	"""
+	A Block, classified by its type, with what was lexed while classifying it so the parser never matches it again
 	"""
-	Yields Blocks from an open file
+	block_type: str
+	line_offset: int
+	lines: Block
+	lexed: Any = None
+
+
+def get_blocks(file: Iterable) -> Iterator[LexedBlock]:
+	"""
+	Yields classified Blocks from an open file
+	"""
+	for line_offset, block in split_blocks(file):
+		yield lex_block(line_offset, block)
+
+
+def split_blocks(lines: Iterable[str], line_number: int=0) -> Iterator[Tuple[int, Block]]:
+	"""
+	Yields the Blocks of lines, separated by blank lines outside of code and math blocks, with the number of their
+	first line. lines must start at the start of a Block, after line_number lines that came before them
 	"""
 	block = []
 	in_blankable_block = False
-	line_number = 0
-	for line_number, line in enumerate(file, 1):
+	for line_number, line in enumerate(lines, line_number + 1):
 
 		if match(re_code_open, line):
 			in_blankable_block = True
@@ -128,78 +225,96 @@ def get_blocks(file: Iterable) -> Iterator[Tuple[int, Block]]:
 			block.append(line)
 
 	if block:
-		yield line_number - len(block), block
+		yield line_number - len(block) + 1, block
 
 
-def get_text_tokens(line_number: int, text: str) -> Iterator[Tuple[str, Tuple[str, ...]]]:
+def lex_block(line_offset: int, block: Block) -> LexedBlock:
+	"""
+	Classifies a Block. Types are tried in order of precedence, the first one that fits is used
+	"""
+	if block_is_horizontal_rule(block):
+		return LexedBlock('horizontal_rule', line_offset, block)
+
+	heading = lex_heading(block)
+	if heading:
+		return LexedBlock('heading', line_offset, block, heading)
+
+	list_items = lex_list(block)
+	if list_items:
+		return LexedBlock('list', line_offset, block, list_items)
+
+	if block_is_code(block):
+		return LexedBlock('code', line_offset, block)
+
+	if block_is_math(block):
+		return LexedBlock('math', line_offset, block)
+
+	table = lex_md_table(block)
+	if table:
+		return LexedBlock('table', line_offset, block, table)
+
+	if block_is_blockquote(block):
+		return LexedBlock('blockquote', line_offset, block)
+
+	return LexedBlock('paragraph', line_offset, block)
+
+
+def get_text_tokens(line_number: int, text: str) -> Iterator[Tuple[TextToken, Tuple[str, ...]]]:
 	"""
 	Yields tokens of the Text type from a string of plain text
 	"""
 	# TODO: Return also the source text for the token for sane error messages
-	disabled = False
-	enabling_token = ''
-	enabling_char = ''
-	disabled_token = ''
-	closing_token = ''
-	while text:
-
-		if disabled:
-			m = match(rf'([^{enabling_char}]*){enabling_char}', text)  # Read up until enabling_char is found
+	pos = 0
+	end = len(text)
+	while pos < end:
+		m = text_scanner.match(text, pos)
+		if not m:
+			raise ContextException(line_number, 'Unrecognized token', text[pos:])
+
+		token, start, stop = text_token_groups[m.lastindex]
+		yield token, m.groups()[start:stop]
+		pos = m.end()
+
+		if token in disabling_tokens and pos < end:
+			enabling_char, disabled_token, closing_token = disabling_tokens[token]
+			m = disabled_scanners[token].match(text, pos)
 			if not m:
-				raise MissingTagException(line_number, enabling_token)
+				raise MissingTagException(line_number, token.name)
 
 			yield disabled_token, m.groups()
 			yield closing_token, (enabling_char,)
+			pos = m.end()
 
-			text = text[len(m.group(0)):]
-			disabled = False
-		else:
-			for exp, val in text_tokens:
-				m = match(exp, text)
-
-				if m:
-					m_len = len(m.group(0))
-
-					if val in disabling_tokens:
-						disabled = True
-						enabling_token = val
-						enabling_char, disabled_token, closing_token = disabling_tokens[val]
 
-					yield val, m.groups()
-					text = text[m_len:]
-					break
-			else:
-				raise ContextException(line_number, 'Unrecognized token', text)
-
-
-def get_math_tokens(line_offset: int, text: str) -> Iterator[Tuple[str, str]]:
+def get_math_tokens(line_offset: int, text: str) -> Iterator[Tuple[int, MathToken, str]]:
 	"""
 	Yields tokens of the Math type from a string of plain text
 	"""
+	newline, whitespace = MathToken.Newline, MathToken.Whitespace
 	line_number = line_offset
-	while text:
-		for exp, val in math_tokens:
-			m = match(exp, text)
+	pos = 0
+	end = len(text)
+	while pos < end:
+		m = math_scanner.match(text, pos)
+		if not m:
+			raise ContextException(line_number, 'Unrecognized math token', text[pos:])
 
-			if m:
-				m_len = len(m.group(0))
+		token, start, _ = math_token_groups[m.lastindex]
+		if token is newline:
+			line_number += 1
 
-				if val == 'Newline':
-					line_number += 1
+		if token is not whitespace:
+			yield line_number, token, m.group(start + 1)
 
-				if val != 'Whitespace':
-					yield line_number, val, m.group(1)
-
-				text = text[m_len:]
-				break
-		else:
-			raise ContextException(line_number, 'Unrecognized math token', text)
+		pos = m.end()
 
 
 def replace_math(text: str) -> str:
-	for k, v in math_subst:
-		text = sub(k, v, text)
-	return text
+	return math_subst.sub(_math_replacement, text)
+
+
+def _math_replacement(m: Match) -> str:
+	return math_subst_table[m.group()]
 
 
 def block_is_horizontal_rule(block: Block) -> bool:
@@ -215,34 +330,39 @@ def block_is_horizontal_rule(block: Block) -> bool:
 	return False
 
 
-def block_is_heading(block: Block) -> bool:
-	if _block_is_underline_heading(block):
-		return True
-	return len(block) == 1 and block[0].startswith('#')
-
-
 def _block_is_underline_heading(block: Block) -> bool:
 	last_line = block[-1].rstrip()
 	return all(char == '=' for char in last_line) or all(char == '-' for char in last_line)
 
 
-def block_is_list(block: Block) -> bool:
+def lex_list(block: Block) -> Optional[List[Tuple[str, Match, Optional[Tuple[str, int]]]]]:
+	"""
+	Returns a tuple (list_type, match, numeral) for every item of a list block, or None if the block is not a list.
+	numeral is the result of lex_olist for ordered list items
+	"""
 	# TODO: Warn if block is almost list?
 	# TODO: allow continuable list items (with an indent)
+	items = []
 	for line in block:
 		# Check if checklist
-		if re_checklistitem.match(line):
+		m = re_checklistitem.match(line)
+		if m:
+			items.append(('checklist', m, None))
 			continue
 		# Check if unordered
-		if re_ulistitem.match(line):
+		m = re_ulistitem.match(line)
+		if m:
+			items.append(('unordered', m, None))
 			continue
 		# Check if ordered
 		m = re_olistitem.match(line)
 		if m:
-			if lex_olist(m):
+			numeral = lex_olist(m)
+			if numeral:
+				items.append(('ordered', m, numeral))
 				continue
-		return False
-	return True
+		return None
+	return items
 
 
 def block_is_code(block: Block) -> bool:
@@ -253,14 +373,17 @@ def block_is_math(block: Block) -> bool:
 	return bool(match(re_math_open, block[0]) and match(re_math_close, block[-1]))
 
 
-def block_is_md_table(block: Block) -> bool:
+def lex_md_table(block: Block) -> Optional[Tuple[List[List[str]], Optional[str]]]:
+	"""
+	Returns a tuple (rows, caption) from a table block, or None if the block is not a table.
+	rows are the header, separator and body rows split into cells
+	"""
 	# TODO: Warn if almost table
-	table_cols = len(block[0].split('|'))
-
-	if table_cols < 2 or len(block) < 3:  # Header + separator + at least one row
-		return False
+	if len(block) < 3:  # Header + separator + at least one row
+		return None
 
 	md_table = block
+	caption = None
 	if len(block) >= 5:  # Header + separator + at least one row + separator + caption
 		# Does it have a caption?
 		for char in block[-2]:
@@ -268,42 +391,33 @@ def block_is_md_table(block: Block) -> bool:
 				break
 		else:
 			md_table = block[:-2]
+			caption = block[-1]
 
-	# Must have he same number of columns for every row
-	for line in md_table:
-		row_cols = len(line.split('|'))
+	rows = [line.split('|') for line in md_table]
 
-		if row_cols != table_cols:
-			return False
+	# Must have he same number of columns for every row
+	table_cols = len(rows[0])
+	if table_cols < 2:
+		return None
+	for row in rows:
+		if len(row) != table_cols:
+			return None
 
 	# There must be at least three dashes in the "separator" row, and only have dashes, colons and whitespace
-	for cell in md_table[1].split('|'):
+	for cell in rows[1]:
 		for char in cell:
 			if char not in '\n \t:-':
-				return False
+				return None
 		if cell.count('-') < 3:
-			return False
+			return None
 
-	return True
+	return rows, caption
 
 
 def block_is_blockquote(block: Block) -> bool:
 	return block[0][0] == '>'
 
 
-def list_item_text(item: str) -> str:
-	"""
-	Return only the text for a list item without its Jotdown syntax
-	"""
-
-	if match(re_olistitem, item):
-		return sub(re_olistitem, '', item)
-	elif match(re_checklistitem, item):
-		return sub(re_checklistitem, '', item)
-	else:
-		return sub(re_ulistitem, '', item)
-
-
 def lex_olist(m: Match) -> Optional[Tuple[str, int]]:
 	"""
 	Attempt to parse a numeral on the list item, be it decimal, roman or alphabetical
@@ -328,15 +442,16 @@ def lex_olist(m: Match) -> Optional[Tuple[str, int]]:
 			return case, value
 
 
-def lex_heading(block: Block) -> Tuple[int, Block]:
+def lex_heading(block: Block) -> Optional[Tuple[int, Block]]:
 	"""
-	Return a tuple (level, text) from a Heading block
+	Return a tuple (level, text) from a Heading block, or None if the block is not a heading
 	"""
 
 	if _block_is_underline_heading(block):
 		level = 1 if block[-1][0] == '=' else 2
 		return level, block[:-1]
-	else:
+	elif len(block) == 1 and block[0].startswith('#'):
 		m = re_heading_hashes.match(block[0])
 		hashes, text = m.groups()
 		return min(len(hashes), 6), [text.strip()]
+	return None
@@ -1,148 +1,330 @@
 # -*- coding: utf-8 -*-
-from typing import Iterator, Iterable, Union, TextIO, List
+from typing import Iterator, Iterable, Union, TextIO, List, Tuple, Match, Optional, Type, Dict, Callable, Any
+from enum import IntEnum
+from bisect import bisect_left
+from io import StringIO
+from itertools import islice
 
 from jotdown.lexer import *
 from jotdown.classes import *
+from jotdown.cache import LRUCache
+from jotdown.context import ParseContext, TocEntry
 from jotdown.errors import LineNumberException, ContextException, MissingTagException
-import jotdown.globalv as globalv
+from jotdown.flat import FlatTree, flatten
 
 import sys
 
 
-def parse(file: Union[Iterable, TextIO]) -> Document:
+def parse(file: Union[Iterable, TextIO], context: ParseContext=None, flat: bool=False) -> Union[Document, FlatTree]:
 	"""
-	Returns a Document Node, the root of a syntax tree. Splits a file into Blocks and parses their contents individually
+	Returns a Document Node, the root of a syntax tree. Splits a file into Blocks and parses their contents individually.
+	If flat, returns the tree as a FlatTree instead, made one Block at a time
 	"""
+	context = context if context else ParseContext()
+	if flat:
+		return flatten(Document(context=context), parse_iter(file, context))
+	return Document(list(parse_iter(file, context)), context=context)
 
-	blocks = get_blocks(file)
-	nodes = []
-	for line_offset, block in blocks:
-		if block_is_horizontal_rule(block):
-			nodes.append(HorizontalRule())
 
-		elif block_is_heading(block):
-			level, text = lex_heading(block)
-			subnodes = []
-			for line in text:
-				subnodes.append(Node(parse_text(line_offset, line)))
-			nodes.append(Heading(level, subnodes))
+def parse_iter(file: Union[Iterable, TextIO], context: ParseContext) -> Iterator[Node]:
+	"""
+	Yields the top-level Nodes of a Document as soon as each Block of the file is read and parsed.
+	References and heading ids are resolved through context, which is finalized once the whole file is parsed.
+	Until then, references that are defined further on in the file can't be emitted
+	"""
+	for lexed_block in get_blocks(file):
+		node = parse_block(lexed_block, context)
+		if node is not None:
+			yield node
 
-		elif block_is_list(block):
-			nodes.append(_parse_list(line_offset, block))
+	context.finalize()
 
-		elif block_is_code(block):
-			nodes.append(CodeBlock(map(Plaintext, block[1:-1])))
 
-		elif block_is_math(block):
-			nodes.append(MathBlock([parse_math(line_offset + 1, replace_math(''.join(block[1:-1])))]))
+def parse_block(lexed_block: LexedBlock, context: ParseContext) -> Optional[Node]:
+	"""
+	Returns the top-level Node parsed from a Block, or None if it has no content of its own, like a paragraph of
+	reference definitions
+	"""
+	block_type, line_offset, block, lexed = lexed_block
+	if block_type == 'horizontal_rule':
+		return HorizontalRule()
 
-		elif block_is_md_table(block):
-			nodes.append(_parse_table(line_offset, block))
+	elif block_type == 'heading':
+		level, text = lexed
+		subnodes = []
+		for line in text:
+			subnodes.append(Node(parse_text(line_offset, line, context)))
+		heading = Heading(level, subnodes)
+		heading.ident = context.add_heading(heading.level, heading)
+		return heading
 
-		elif block_is_blockquote(block):
-			nodes.append(_parse_blockquote(line_offset, block))
-		else:
-			# Default case, paragraphs
-			subnodes = []
-			for line in block:
-				text_nodes = parse_text(line_offset, line)
-				if text_nodes:
-					subnodes.append(Node(text_nodes))
-			if subnodes:
-				nodes.append(Paragraph(subnodes))
+	elif block_type == 'list':
+		return _parse_list(line_offset, lexed, context)
+
+	elif block_type == 'code':
+		return CodeBlock([Plaintext(line) for line in block[1:-1]])
+
+	elif block_type == 'math':
+		return MathBlock([parse_math_source(line_offset + 1, ''.join(block[1:-1]))])
+
+	elif block_type == 'table':
+		return _parse_table(line_offset, block, *lexed, context)
+
+	elif block_type == 'blockquote':
+		return _parse_blockquote(line_offset, block, context)
+	else:
+		# Default case, paragraphs
+		subnodes = []
+		for line in block:
+			text_nodes = parse_text(line_offset, line, context)
+			if text_nodes:
+				subnodes.append(Node(text_nodes))
+		return Paragraph(subnodes) if subnodes else None
 
-	return Document(nodes)
+
+class ParsedSource:
+	"""
+	The source of a Document split into its Blocks, kept so that it can be parsed again one Block at a time.
+	For each Block, in order: the number of its first line, its number of lines, its top-level Node, if any, and the
+	references and headings found in it, if any, in a ParseContext of its own. context gathers those of every Block
+	"""
+	__slots__ = ('lines', 'offsets', 'lengths', 'nodes', 'contexts', 'context')
+
+	def __init__(self) -> None:
+		self.lines: List[str] = []
+		self.offsets: List[int] = []
+		self.lengths: List[int] = []
+		self.nodes: List[Optional[Node]] = []
+		self.contexts: List[Optional[ParseContext]] = []
+		self.context = ParseContext()
+		self.context.finalize()
+
+	def edit(self, start: int, end: int, replacement: List[str]) -> None:
+		"""
+		Replaces the lines from start up to, but not including, end, counted from 1, and parses the Blocks that
+		changed again. Blocks after the edit are kept and only moved, once splitting the source meets them again
+		"""
+		lines = self.lines[:start - 1] + replacement + self.lines[end - 1:]
+		shift = len(replacement) - (end - start)
+		edit_end = start + len(replacement)  # First line after the edit, in the new source
+
+		# Splitting starts at the last Block that begins before the edit, which may join with it
+		first = bisect_left(self.offsets, start)
+		if first:
+			first -= 1
+			line_number = self.offsets[first] - 1
+		else:
+			line_number = 0
+
+		offsets, lengths, nodes, contexts = [], [], [], []
+		last = len(self.offsets)
+		for line_offset, block in split_blocks(islice(lines, line_number, None), line_number):
+			if line_offset >= edit_end:
+				# Splitting is the same as before from any Block that starts where one did after the edit
+				old = bisect_left(self.offsets, line_offset - shift, first)
+				if old < last and self.offsets[old] == line_offset - shift and self.offsets[old] >= end:
+					last = old
+					break
+
+			context = ParseContext()
+			node = parse_block(lex_block(line_offset, block), context)
+			offsets.append(line_offset)
+			lengths.append(len(block))
+			nodes.append(node)
+			contexts.append(context if context.references or context.toc else None)
+
+		# Nothing changes until every Block is parsed, so that a Block that can't be parsed leaves it as it was
+		old_contexts = self.contexts[first:last]
+		self.lines = lines
+		self.offsets[first:] = offsets + [i + shift for i in self.offsets[last:]]
+		self.lengths[first:last] = lengths
+		self.nodes[first:last] = nodes
+		self.contexts[first:last] = contexts
+
+		if not self._replace_headings(old_contexts, contexts):
+			self.context = ParseContext()
+			for context in self.contexts:
+				if context is not None:
+					self.context.add_block(context)
+			self.context.finalize()
+
+	def children(self) -> List[Node]:
+		return [node for node in self.nodes if node is not None]
+
+	def _replace_headings(self, old: List[Optional[ParseContext]], new: List[Optional[ParseContext]]) -> bool:
+		"""
+		Puts the headings of new Blocks in place of the ones of the old Blocks they replace in context, when that is all
+		that changed: they cite the same references in the same order, define none, and have the same headings but
+		for their content. Returns whether it did, or context has to be gathered again from every Block
+		"""
+		old = [i for i in old if i is not None]
+		new = [i for i in new if i is not None]
+		if [_block_signature(i) for i in old] != [_block_signature(i) for i in new]:
+			return False
+		if any(definition is not None for i in old + new for definition in i.references.values()):
+			return False
+
+		toc = self.context.toc
+		for old_context, new_context in zip(old, new):
+			for old_entry, (level, _, heading) in zip(old_context.toc, new_context.toc):
+				ident = old_entry.heading.ident
+				heading.ident = ident
+				toc[toc.index(TocEntry(level, ident, old_entry.heading))] = TocEntry(level, ident, heading)
+		return True
+
+
+def _block_signature(context: ParseContext) -> Tuple[Tuple[str, ...], Tuple[Tuple[int, str], ...]]:
+	"""
+	What a Block adds to the context of its Document: the references it cites, and the level and base anchor of its
+	headings
+	"""
+	return tuple(context.references), tuple((level, ident) for level, ident, _ in context.toc)
 
 
-def parse_text(line_number: int, text: str) -> Sequence[Node]:
+def update(document: Document, source: str, start: int=None, end: int=None) -> Document:
+	"""
+	Updates document to a new version of its source, parsing again only the Blocks that changed.
+	If start is given, source replaces the lines of the current source from start up to, but not including, end,
+	counted from 1. Otherwise, source is the whole new source, and the lines that changed are found by comparing it
+	with the current one
+	"""
+	replacement = list(StringIO(source, newline=None))
+	parsed = document.source
+	if parsed is None:
+		if start is not None:
+			raise ValueError('The whole source of a Document is needed to update it for the first time')
+		parsed = ParsedSource()
+
+	if start is None:
+		old = parsed.lines
+		prefix = 0
+		for prefix, (old_line, new_line) in enumerate(zip(old, replacement), 1):
+			if old_line != new_line:
+				prefix -= 1
+				break
+		suffix = 0
+		limit = min(len(old), len(replacement)) - prefix
+		while suffix < limit and old[-1 - suffix] == replacement[-1 - suffix]:
+			suffix += 1
+		start, end = prefix + 1, len(old) - suffix + 1
+		replacement = replacement[prefix:len(replacement) - suffix]
+	elif end is None:
+		end = start
+
+	parsed.edit(start, end, replacement)
+	document.source = parsed
+	document.children = parsed.children()
+	document.context = parsed.context
+	return document
+
+
+def parse_text(line_number: int, text: str, context: ParseContext) -> Sequence[Node]:
 	"""
 	Returns a Node, root to a syntax subtree, from plain text
 	"""
 
 	# Start the parser up with a dummy top-level node
 	# Keep track of the nested nodes and their type
-	stack: List[Tuple[str, Node]] = [('Dummy_OPEN', Node())]
+	stack: List[Tuple[Optional[TextToken], Node]] = [(None, Node())]
 
 	for token, groups in get_text_tokens(line_number, text):
-		if token.endswith('_OPEN'):
+		role, action = text_token_table[token]
+		if role == LEAF:
+			action(stack[-1][1].children, line_number, groups, context)
+
+		elif role == AMBIGUOUS:
+			# General rules for tags opened and closed by the same token
+			if token == stack[-1][0]:
+				# Close the node
+				_, closed_node = stack.pop()
+				stack[-1][1].children.append(closed_node)
+			else:
+				# Open a node
+				stack.append((token, action()))
+
+		elif role == OPEN:
 			# General rule for NODE_OPEN or NODE_CLOSE tokens
-			node_type, *node_subtypes, open_or_close = token.split('_')
-			node_class = globals()[node_type]
-			stack.append((token, node_class()))
+			stack.append((token, action()))
 
-		elif token.endswith('_CLOSE'):
-			node_type, *node_subtypes, open_or_close = token.split('_')
+		else:
 			tos_token, _ = stack[-1]
-			tos_node_type, *tos_subtypes, tos_open_or_close = tos_token.split('_')
-			if not tos_node_type == 'Dummy':
-				if (
-						tos_node_type == node_type and tos_subtypes == node_subtypes
-						and tos_open_or_close == 'OPEN'
-				):
+			if tos_token is not None:
+				if tos_token in action:
 					_, closed_node = stack.pop()
 					stack[-1][1].children.append(closed_node)
 				else:
 					# TODO: point out the characters where the tag is opened
 					# TODO: this is never called. When opening a new node, check that one of the same
 					# type is not awaiting closure on the stack
-					raise MissingTagException(line_number, tos_token, encountered_tag=token)
+					raise MissingTagException(line_number, tos_token.name, encountered_tag=token.name)
 			else:
 				# Trying to close a tag that was never opened
-				raise MissingTagException(line_number, token, opening=True)
+				raise MissingTagException(line_number, token.name, opening=True)
 
-		elif token.endswith('_AMB'):
-			# General rules for tags opened and closed by the same token
-			if token == stack[-1][0]:
-				# Close the node
-				_, closed_node = stack.pop()
-				stack[-1][1].children.append(closed_node)
-			else:
-				# Open a node
-				node_type, *_, _ = token.split('_')
-				node_class = globals()[node_type]
-				stack.append((token, node_class()))
-
-		elif token == "Plaintext":
-			# Combine consecutive Plaintext nodes to reduce the overall number of Nodes created
-			tos_children = stack[-1][1].children
-			if tos_children and isinstance(tos_children[-1], Plaintext):
-				tos_children[-1].text += groups[0]
-			else:
-				stack[-1][1].children.append(Plaintext(groups[0]))
+	if len(stack) > 1:
+		raise MissingTagException(line_number, stack[-1][0].name)
+	return stack[0][1].children
 
-		elif token == "Math":
-			stack[-1][1].children.append(parse_math(line_number, replace_math(groups[0])))
 
-		elif token == "ImplicitLink":
-			stack[-1][1].children.append(ImplicitLink(TextNode(groups[0]), groups[0]))
+def _parse_plaintext(children: List[Node], line_number: int, groups: Tuple[str, ...], context: ParseContext) -> None:
+	# Combine consecutive Plaintext nodes to reduce the overall number of Nodes created
+	if children and isinstance(children[-1], Plaintext):
+		children[-1].text += groups[0]
+	else:
+		children.append(Plaintext(groups[0]))
 
-		elif token == "ImplicitEmail":
-			stack[-1][1].children.append(ImplicitLink(TextNode(groups[0]), f'mailto: {groups[0]}'))
 
-		elif token == "Link":
-			text, href = groups
-			stack[-1][1].children.append(Link(Node(parse_text(line_number, text)), href))
+def _parse_math_inline(children: List[Node], line_number: int, groups: Tuple[str, ...], context: ParseContext) -> None:
+	children.append(parse_math_source(line_number, groups[0]))
 
-		elif token == "ReferenceLink":
-			cited_text, ref_key = groups
-			stack[-1][1].children.append(ReferenceLink(Node(parse_text(line_number, cited_text)), ref_key))
-			globalv.references[ref_key] = None  # Save its place in the OrderedDict
 
-		elif token == "ReferenceDef":
-			ref_key, reference_text = groups
+def _parse_implicit_link(children: List[Node], line_number: int, groups: Tuple[str, ...], context: ParseContext) -> None:
+	children.append(ImplicitLink(TextNode(groups[0]), groups[0]))
 
-			# TODO: Should parse on emit, or only when reference mode is enabled
-			globalv.references[ref_key] = Node(parse_text(line_number, reference_text)), reference_text
 
-		elif token == "Image":
-			alt, src, title = groups
-			alt = Node(parse_text(line_number, alt)) if alt else TextNode('')
-			title = Node(parse_text(line_number, title)) if title else TextNode('')
-			stack[-1][1].children.append(Content(alt, src, title))
+def _parse_implicit_email(children: List[Node], line_number: int, groups: Tuple[str, ...], context: ParseContext) -> None:
+	children.append(ImplicitLink(TextNode(groups[0]), f'mailto: {groups[0]}'))
 
-	if len(stack) > 1:
-		raise MissingTagException(line_number, stack[-1][0])
-	return stack[0][1].children
+
+def _parse_link(children: List[Node], line_number: int, groups: Tuple[str, ...], context: ParseContext) -> None:
+	text, href = groups
+	children.append(Link(Node(parse_text(line_number, text, context)), href))
+
+
+def _parse_reference_link(children: List[Node], line_number: int, groups: Tuple[str, ...], context: ParseContext) -> None:
+	cited_text, ref_key = groups
+	children.append(ReferenceLink(Node(parse_text(line_number, cited_text, context)), ref_key))
+	context.cite(ref_key)
+
+
+def _parse_reference_def(children: List[Node], line_number: int, groups: Tuple[str, ...], context: ParseContext) -> None:
+	ref_key, reference_text = groups
+
+	# TODO: Should parse on emit, or only when reference mode is enabled
+	context.define_reference(ref_key, (Node(parse_text(line_number, reference_text, context)), reference_text))
+
+
+def _parse_image(children: List[Node], line_number: int, groups: Tuple[str, ...], context: ParseContext) -> None:
+	alt, src, title = groups
+	alt = Node(parse_text(line_number, alt, context)) if alt else TextNode('')
+	title = Node(parse_text(line_number, title, context)) if title else TextNode('')
+	children.append(Content(alt, src, title))
+
+
+# Parsed formulas by their source text, shared by every Document parsed by the process
+math_cache = LRUCache(4096)
+
+
+def parse_math_source(line_offset: int, source: str) -> Math:
+	"""
+	Returns a Math Node from the source text of a formula, reusing the one parsed before for the same source.
+	The Node may be shared by many Documents, so it must not be modified
+	"""
+	math = math_cache.get(source)
+	if math is None:
+		math = parse_math(line_offset, replace_math(source))
+		math_cache.put(source, math)
+	return math
 
 
 def parse_math(line_offset: int, text: str) -> Math:
@@ -151,60 +333,90 @@ def parse_math(line_offset: int, text: str) -> Math:
 	"""
 
 	# Keep track of the nested nodes and their types
-	stack = ['Math_OPEN']
+	stack = [MathToken.Math_OPEN]
 	node_stack = [Math()]
 	debug_text = text[:50] if len(text) <= 50 else text[:47] + '...'  # For error messages
 	line_number = line_offset
 
 	for line_number, token, text in get_math_tokens(line_offset, text):
-		if '_OPEN' in token:
-			node_class = globals()[token.split('_')[0]]
+		role, action = math_token_table[token]
+		if role == LEAF:  # text tokens
+			node_stack[-1].children.append(action(text))
+		elif role == OPEN:
 			stack.append(token)
-			node_stack.append(node_class())
-		elif '_CLOSE' in token:
-			node, _ = token.split('_')
+			node_stack.append(action())
+		else:
 			tos_token = stack[-1]
-			if '_' in tos_token:
-				tos_node, tos_type = tos_token.split('_')
-				if tos_node == node and tos_type == 'OPEN' \
-					or tos_node in bracket_closable and tos_type == 'OPEN' and node == 'Brackets':
-					stack.pop()
-					closed_node = node_stack.pop()
-					node_stack[-1].children.append(closed_node)
-				else:
-					raise Exception("Expected closing math tag for %s at line %d, found %s" % (tos_token, line_number, token))
+			if tos_token in action:
+				stack.pop()
+				closed_node = node_stack.pop()
+				node_stack[-1].children.append(closed_node)
 			else:
-				raise Exception("Malformed document at line %d: %s" % (line_number, text))
-		else:  # text tokens
-			node_class = globals()[token]  # TODO: Read from the module, not the globals
-			node_stack[-1].children.append(node_class(text))
+				raise Exception(
+					"Expected closing math tag for %s at line %d, found %s" % (tos_token.name, line_number, token.name)
+				)
 
 	if len(stack) > 1:
-		raise Exception("Missing closing math tag for %s at line %d: %s" % (stack[-1], line_number, repr(debug_text)))
+		raise Exception("Missing closing math tag for %s at line %d: %s" % (stack[-1].name, line_number, repr(debug_text)))
 	return node_stack[0]
 
 
-def _parse_list(line_offset: int, block: Block) -> ListNode:
+def _token_table(tokens: Type[IntEnum], leaf_actions: Dict[IntEnum, Callable]) -> Dict[IntEnum, Tuple[int, Any]]:
+	"""
+	Maps every token to its role in the parser, and what to do with it:
+	the Node class to instantiate for opening tokens, the set of tokens that can be closed by a closing token,
+	or the action for the rest of tokens
+	"""
+	table = {}
+	for token in tokens:
+		node_type, *_, role = token.name.split('_') if '_' in token.name else (token.name, None)
+		if role == 'OPEN':
+			table[token] = OPEN, globals()[node_type]
+		elif role == 'CLOSE':
+			closable = {tokens[f'{node_type}_OPEN']}
+			if node_type == 'Brackets':
+				closable.update(tokens[f'{i}_OPEN'] for i in bracket_closable)
+			table[token] = CLOSE, closable
+		elif role == 'AMB':
+			table[token] = AMBIGUOUS, globals()[node_type]
+		elif token in leaf_actions:
+			table[token] = LEAF, leaf_actions[token]
+	return table
+
+
+# Roles of tokens in the parser
+OPEN, CLOSE, AMBIGUOUS, LEAF = range(4)
+
+text_token_table = _token_table(TextToken, {
+	TextToken.Plaintext: _parse_plaintext,
+	TextToken.Math: _parse_math_inline,
+	TextToken.ImplicitLink: _parse_implicit_link,
+	TextToken.ImplicitEmail: _parse_implicit_email,
+	TextToken.Link: _parse_link,
+	TextToken.ReferenceLink: _parse_reference_link,
+	TextToken.ReferenceDef: _parse_reference_def,
+	TextToken.Image: _parse_image,
+})
+
+# Math tokens that are not tags are instances of the Node class of the same name
+math_token_table = _token_table(MathToken, {
+	token: globals()[token.name] for token in MathToken if token.name in globals() and token is not MathToken.Whitespace
+})
+
+
+def _parse_list(
+		line_offset: int,
+		items: List[Tuple[str, Match, Optional[Tuple[str, int]]]],
+		context: ParseContext
+) -> ListNode:
 	"""
-	Returns a ListNode (ordered, unordered or checklist) from a block of text
+	Returns a ListNode (ordered, unordered or checklist) from the lexed items of a list block
 	"""
 	# Keep track of nested lists and their indent levels
 	list_stack = []
 	indent_stack = [-1]
 
-	for line_number, line in enumerate(block, line_offset):
-		# Figure out the type of list
-		list_type = 'checklist'  # by default
-		m = re_checklistitem.match(line)
-		if not m:
-			list_type = 'unordered'
-			m = re_ulistitem.match(line)
-			if not m:
-				list_type = 'ordered'
-				m = re_olistitem.match(line)
-				if not m:
-					raise Exception('Malformed list item at line %d: %s' % (line_number, line))
-
+	for line_number, (list_type, m, numeral) in enumerate(items, line_offset):
 		# Indent level of the current line
 		new_indent = len(m.group(1))
 
@@ -214,7 +426,7 @@ def _parse_list(line_offset: int, block: Block) -> ListNode:
 				indent_stack.append(indent_stack[-1] + 1)
 
 				if list_type == 'ordered':
-					olist_type, start = lex_olist(m)
+					olist_type, start = numeral
 					list_stack.append(OList(list_type=olist_type, start=start))
 				elif list_type == 'unordered':
 					list_stack.append(UList())
@@ -226,13 +438,15 @@ def _parse_list(line_offset: int, block: Block) -> ListNode:
 			closed_list = list_stack.pop()
 			list_stack[-1].children[-1].children.append(closed_list)
 
+		# Only the text for the list item, without its Jotdown syntax
+		item_text = m.string[m.end():]
+
 		# If checklist, set its state
 		if isinstance(list_stack[-1], CheckList):
-			m = re_checklistitem.match(line)
-			checked = bool(m.group(2))
-			list_stack[-1].children.append(ChecklistItem(checked, parse_text(line_number, list_item_text(line))))
+			checked = list_type == 'checklist' and bool(m.group(2))
+			list_stack[-1].children.append(ChecklistItem(checked, parse_text(line_number, item_text, context)))
 		else:
-			list_stack[-1].children.append(ListItem(parse_text(line_number, list_item_text(line))))
+			list_stack[-1].children.append(ListItem(parse_text(line_number, item_text, context)))
 
 	# Finish closing remaining nested lists
 	while len(list_stack) > 1:
@@ -242,39 +456,37 @@ def _parse_list(line_offset: int, block: Block) -> ListNode:
 	return list_stack[0]
 
 
-def _parse_table(line_offset: int, block: Block) -> Table:
+def _parse_table(
+		line_offset: int,
+		block: Block,
+		rows: List[List[str]],
+		caption_line: Optional[str],
+		context: ParseContext
+) -> Table:
 	"""
-	Returns a Table Node from a block of text
+	Returns a Table Node from a block of text and its rows, already split into cells
 	"""
 
-	header_content = block[0].split('|')
-	header = [TableHeader(parse_text(line_offset, i)) for i in header_content]
+	header = [TableHeader(parse_text(line_offset, i, context)) for i in rows[0]]
 
-	column_alignment = list(map(_cell_align, block[1].split('|')))
+	column_alignment = list(map(_cell_align, rows[1]))
 
-	# Check if there is a caption
-	md_table = block[2:]
 	caption = None
-	if len(block) > 5:
-		for char in block[-2]:
-			if char not in '\t\n -':
-				break
-		else:
-			caption = parse_text(line_offset + len(block) - 1, block[-1])
-			md_table = block[2:-2]
+	if caption_line is not None:
+		caption = parse_text(line_offset + len(block) - 1, caption_line, context)
 
 	table = Table(caption, column_alignment, [TableRow(header)])
 
-	for line_number, line in enumerate(md_table, line_offset + 2):
+	for line_number, row in enumerate(rows[2:], line_offset + 2):
 		cells = []
-		for content, cell_alignment in zip(line.split('|'), column_alignment):
-			cells.append(TableCell(cell_alignment, parse_text(line_number, content)))
+		for content, cell_alignment in zip(row, column_alignment):
+			cells.append(TableCell(cell_alignment, parse_text(line_number, content, context)))
 		table.children.append(TableRow(cells))
 
 	return table
 
 
-def _parse_blockquote(line_offset: int, block: Block) -> Blockquote:
+def _parse_blockquote(line_offset: int, block: Block, context: ParseContext) -> Blockquote:
 	blockquote_stack = []
 	indent_stack = [0]
 
@@ -295,7 +507,7 @@ def _parse_blockquote(line_offset: int, block: Block) -> Blockquote:
 			closed_block = blockquote_stack.pop()
 			blockquote_stack[-1].children.append(closed_block)
 
-		blockquote_stack[-1].children.append(Node(parse_text(line_number, re_blockquoteline.sub('', line))))
+		blockquote_stack[-1].children.append(Node(parse_text(line_number, line[m.end():], context)))
 
 	while len(blockquote_stack) > 1:
 		indent_stack.pop()
@@ -1,4 +1,4 @@
-from re import compile
+from re import compile, escape
 
 from jotdown.globalv import re_flags
 
@@ -14,110 +14,124 @@ math_exp = {
 # Regex used for only substituting something if it's its own word
 word_re = r'(?:\b|(?<=[%(not_letter)s]))%%s(?:\b|(?=[%(not_letter)s]))' % math_exp
 
-math_subst = [
+# Keywords only substituted if they are their own word
+math_words = [
 # Greek alphabet
-(word_re % 'ALPHA', 'Α'),
-(word_re % 'BETA', 'Β'),
-(word_re % 'GAMMA', 'Γ'),
-(word_re % 'DELTA', 'Δ'),
-(word_re % 'EPSILON', 'Ε'),
-(word_re % 'ZETA', 'Ζ'),
-(word_re % 'ETA', 'Η'),
-(word_re % 'THETA', 'Θ'),
-(word_re % 'IOTA', 'Ι'),
-(word_re % 'KAPPA', 'Κ'),
-(word_re % 'LAMBDA', 'Λ'),
-(word_re % 'MU', 'Μ'),
-(word_re % 'NU', 'Ν'),
-(word_re % 'XI', 'Ξ'),
-(word_re % 'OMICRON', 'Ο'),
-(word_re % 'PI', 'Π'),
-(word_re % 'RHO', 'Ρ'),
-(word_re % 'SIGMA', 'Σ'),
-(word_re % 'TAU', 'Τ'),
-(word_re % 'YPSILON', 'Υ'),
-(word_re % 'PHI', 'Φ'),
-(word_re % 'CHI', 'Χ'),
-(word_re % 'PSI', 'Ψ'),
-(word_re % 'OMEGA', 'Ω'),
-(word_re % 'alpha', 'α'),
-(word_re % 'beta', 'β'),
-(word_re % 'gamma', 'γ'),
-(word_re % 'delta', 'δ'),
-(word_re % 'epsilon', 'ε'),
-(word_re % 'zeta', 'ζ'),
-(word_re % 'eta', 'η'),
-(word_re % 'theta', 'θ'),
-(word_re % 'iota', 'ι'),
-(word_re % 'kappa', 'κ'),
-(word_re % 'lambda', 'λ'),
-(word_re % 'mu', 'μ'),
-(word_re % 'nu', 'ν'),
-(word_re % 'xi', 'ξ'),
-(word_re % 'omicron', 'ο'),
-(word_re % 'pi', 'π'),
-(word_re % 'rho', 'ρ'),
-(word_re % 'sigma', 'σ'),
-(word_re % 'tau', 'τ'),
-(word_re % 'ypsilon', 'υ'),
-(word_re % 'phi', 'φ'),
-(word_re % 'chi', 'χ'),
-(word_re % 'psi', 'ψ'),
-(word_re % 'omega', 'ω'),
+('ALPHA', 'Α'),
+('BETA', 'Β'),
+('GAMMA', 'Γ'),
+('DELTA', 'Δ'),
+('EPSILON', 'Ε'),
+('ZETA', 'Ζ'),
+('ETA', 'Η'),
+('THETA', 'Θ'),
+('IOTA', 'Ι'),
+('KAPPA', 'Κ'),
+('LAMBDA', 'Λ'),
+('MU', 'Μ'),
+('NU', 'Ν'),
+('XI', 'Ξ'),
+('OMICRON', 'Ο'),
+('PI', 'Π'),
+('RHO', 'Ρ'),
+('SIGMA', 'Σ'),
+('TAU', 'Τ'),
+('YPSILON', 'Υ'),
+('PHI', 'Φ'),
+('CHI', 'Χ'),
+('PSI', 'Ψ'),
+('OMEGA', 'Ω'),
+('alpha', 'α'),
+('beta', 'β'),
+('gamma', 'γ'),
+('delta', 'δ'),
+('epsilon', 'ε'),
+('zeta', 'ζ'),
+('eta', 'η'),
+('theta', 'θ'),
+('iota', 'ι'),
+('kappa', 'κ'),
+('lambda', 'λ'),
+('mu', 'μ'),
+('nu', 'ν'),
+('xi', 'ξ'),
+('omicron', 'ο'),
+('pi', 'π'),
+('rho', 'ρ'),
+('sigma', 'σ'),
+('tau', 'τ'),
+('ypsilon', 'υ'),
+('phi', 'φ'),
+('chi', 'χ'),
+('psi', 'ψ'),
+('omega', 'ω'),
 
 # Number sets
-(word_re % 'NATURALS', 'ℕ'),
-(word_re % 'INTEGERS', 'ℤ'),
-(word_re % 'RATIONALS', 'ℚ'),
-(word_re % 'REALS', 'ℝ'),
-(word_re % 'COMPLEX', 'ℂ'),
+('NATURALS', 'ℕ'),
+('INTEGERS', 'ℤ'),
+('RATIONALS', 'ℚ'),
+('REALS', 'ℝ'),
+('COMPLEX', 'ℂ'),
 
 # Infinities
-(word_re % 'INF', '∞'),
-(word_re % 'ALEPH', 'ℵ'),
+('INF', '∞'),
+('ALEPH', 'ℵ'),
 
 # Logic
-(word_re % 'AND', '∧'),
-(word_re % 'OR', '∨'),
-(word_re % 'XOR', '⊕'),
+('AND', '∧'),
+('OR', '∨'),
+('XOR', '⊕'),
 
+# Sets
+('UNION', '∪'),
+('INTERSECTION', '∩'),
+('EMPTY', 'Ø'),
+
+# Quantification
+('FORALL', '∀'),
+('!EXISTS', '∄'),
+('EXISTS', '∃')
+]
+
+# Symbols substituted wherever they appear. When several start at the same place, the first one listed wins
+math_symbols = [
 # Relation operators
-(r'<->', '↔'),
-(r'->', '→'),
-(r'<-', '←'),
-(r'~=', '≈'),
-(r'~', '∼'),
-(r'!=', '≠'),
-(r'\?=', '≟'),
-(r'<=', '≤'),
-(r'>=', '≥'),
-(r':\.|\.:', '∴'),
+('<->', '↔'),
+('->', '→'),
+('<-', '←'),
+('~=', '≈'),
+('~', '∼'),
+('!=', '≠'),
+('?=', '≟'),
+('<=', '≤'),
+('>=', '≥'),
+(':.', '∴'),
+('.:', '∴'),
 
 # Sets
-(r'€', '∈'),
-(r'!€', '∉'),
-(r'!©=', '⊈'),
-(r'!©', '⊄'),
-(r'©=', '⊆'),
-(r'©', '⊂'),
-(r'ø', '∅'),
-(r'[Ĉĉ]', '^∁'),
-(word_re % 'UNION', '∪'),
-(word_re % 'INTERSECTION', '∩'),
-(word_re % 'EMPTY', 'Ø'),
+('!€', '∉'),
+('€', '∈'),
+('!©=', '⊈'),
+('!©', '⊄'),
+('©=', '⊆'),
+('©', '⊂'),
+('ø', '∅'),
+('Ĉ', '^∁'),
+('ĉ', '^∁'),
 
 # More operators
-(r'\.\.\.', '…'),
-(r'\+/-', '±'),
-(r'-', '−'),
-
-# Quantification
-(word_re % 'FORALL', '∀'),
-(word_re % '!EXISTS', '∄'),
-(word_re % 'EXISTS', '∃')
+('...', '…'),
+('+/-', '±'),
+('-', '−')
 ]
 
-math_subst = [(compile(exp, flags=re_flags), val) for (exp, val) in math_subst]
+# All substitutions are done in a single pass, with a lookup of the matched text in math_subst_table
+math_subst = compile(
+	word_re % f'(?:{"|".join(escape(word) for word, _ in math_words)})' +
+	'|' + '|'.join(escape(symbol) for symbol, _ in math_symbols),
+	flags=re_flags
+)
+math_subst_table = dict(math_words + math_symbols)
 
 latex_math_subst = [
 # Greek alphabet
@@ -222,4 +236,5 @@ latex_math_subst = [
 ('∃', r'\exists ')
 ]
 
-#latex_math_subst = [(compile(exp, flags=re_flags), val) for (exp, val) in latex_math_subst]
\ No newline at end of file
+# Every symbol is a single character, so they are all replaced in one pass by str.translate
+latex_math_table = str.maketrans(dict(latex_math_subst))
\ No newline at end of file
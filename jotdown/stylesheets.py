@@ -0,0 +1,88 @@
+"""
+Process-wide cache of stylesheets and document templates, shared by every document emitted by the process.
+"""
+import os
+import re
+import typing
+
+import jotdown.globalv as globalv
+
+# Only named string fields and escaped percent signs can be filled in by joining the template's parts
+re_template_field = re.compile(r'%(?:\((\w+)\)s|(%))')
+re_template_specifier = re.compile(r'%(?:\(\w+\)s|%)|(%)')
+
+
+class Template:
+	"""
+	A %-format template, split into its literal text and field names
+	"""
+	def __init__(self, text: str) -> None:
+		self.text = text
+		self.parts: typing.Optional[typing.List[typing.Tuple[str, typing.Optional[str]]]] = []  # (literal, field)
+
+		if any(m.group(1) for m in re_template_specifier.finditer(text)):
+			# Has other conversion specifiers, leave them to the % operator
+			self.parts = None
+			return
+
+		pos = 0
+		for m in re_template_field.finditer(text):
+			field, percent = m.groups()
+			self.parts.append((text[pos:m.start()] + (percent or ''), field))
+			pos = m.end()
+		self.parts.append((text[pos:], None))
+
+	def __mod__(self, fields: typing.Mapping[str, typing.Any]) -> str:
+		if self.parts is None:
+			return self.text % fields
+
+		res = []
+		for literal, field in self.parts:
+			res.append(literal)
+			if field is not None:
+				res.append(str(fields[field]))
+		return ''.join(res)
+
+	def iter_fill(self, fields: typing.Mapping[str, typing.Any]) -> typing.Iterator[typing.Any]:
+		"""
+		Like the % operator, but yields the template's parts in order instead of joining them.
+		Fields that are iterators are yielded as they are, to be emitted in place. Templates that can only be
+		filled in by the % operator need every field as a string
+		"""
+		if self.parts is None:
+			yield self.text % fields
+			return
+
+		for literal, field in self.parts:
+			yield literal
+			if field is not None:
+				value = fields[field]
+				yield value if isinstance(value, typing.Iterator) else str(value)
+
+
+# Absolute path: ((size, mtime), Template)
+_cache: typing.Dict[str, typing.Tuple[typing.Tuple[int, int], Template]] = {}
+
+
+def load_template(path: str) -> Template:
+	"""
+	Returns the decoded and split contents of a stylesheet or template file, reading it again only if it was modified
+	"""
+	path = os.path.abspath(path)
+	stat = os.stat(path)
+	key = stat.st_size, stat.st_mtime_ns
+
+	cached = _cache.get(path)
+	if cached and cached[0] == key:
+		return cached[1]
+
+	template = Template(globalv.read_with_encoding(path))
+	_cache[path] = key, template
+	return template
+
+
+def read_stylesheet(path: str) -> str:
+	"""
+	Returns the decoded contents of a stylesheet file, reading it again only if it was modified
+	"""
+	return load_template(path).text
@@ -0,0 +1,77 @@
+import gc
+import os
+import unittest
+
+from jotdown.classes import Document, Plaintext, Paragraph, block_cache, structure_hash
+
+styles = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'styles')
+html_options = {'stylesheet': os.path.join(styles, 'solarized.css'), 'embed_css': False}
+rtf_options = {'stylesheet': os.path.join(styles, 'solarized.rtf'), 'ref_style': True}
+
+
+def body(doc: Document, **kwargs) -> str:
+	return doc.emit('html', **html_options, **kwargs).split('<body>')[1].split('<footer>')[0]
+
+
+class BlockCacheTest(unittest.TestCase):
+	def setUp(self) -> None:
+		block_cache.clear()
+
+	def test_emit_twice(self) -> None:
+		doc = Document().update('# Title\n\nSome *text*\n')
+		self.assertEqual(body(doc), body(doc))
+
+	def test_other_documents(self) -> None:
+		# Documents that are freed may leave their nodes' addresses to the next ones
+		for caption in ('ONE', 'TWO', 'THREE', 'FOUR', 'FIVE'):
+			doc = Document().update(f'a | b\n--- | ---\n1 | 2\n-------\nCaption {caption}\n')
+			self.assertIn(f'Caption {caption}', body(doc))
+			del doc
+			gc.collect()
+
+	def test_structure_hash(self) -> None:
+		# Hashes must not depend on where nodes are, like the repr of a caption, which is a list of nodes, does
+		table = 'a | b\n--- | ---\n1 | 2\n-------\nCaption {}\n'
+		one, other = Document().update(table.format('ONE')), Document().update(table.format('ONE'))
+		self.assertEqual(structure_hash(one.children[0]), structure_hash(other.children[0]))
+		two = Document().update(table.format('TWO'))
+		self.assertNotEqual(structure_hash(one.children[0]), structure_hash(two.children[0]))
+
+	def test_children_replaced(self) -> None:
+		doc = Document().update('Some text\n')
+		body(doc)
+		paragraph = doc.children[0]
+		paragraph.children = list(paragraph.children) + [Plaintext('APPENDED')]
+		self.assertIn('APPENDED', body(doc))
+
+		doc.children.append(Paragraph([Plaintext('ADDED')]))
+		self.assertIn('ADDED', body(doc))
+
+	def test_renumbered_anchor(self) -> None:
+		doc = Document().update('# A\n\ntext\n\n# A\n')
+		self.assertIn('id="A_"', body(doc))
+		doc.update('# A\n\n', 1, 1)
+		self.assertEqual(body(doc).count('id="A_'), 2)
+		self.assertIn('id="A__"', body(doc))
+
+	def test_renumbered_reference(self) -> None:
+		doc = Document().update('see [a][x]\n\nand [b][y]\n\n[x]: http://x\n[y]: http://y\n')
+		self.assertIn('href="#y" class="reference">2<', body(doc, ref_style=True))
+		doc.update('first [c][y]\n\n', 1, 1)
+		output = body(doc, ref_style=True)
+		self.assertIn('href="#y" class="reference">1<', output)
+		self.assertIn('href="#x" class="reference">2<', output)
+		self.assertNotIn('class="reference">3<', output)
+
+	def test_nested_definition(self) -> None:
+		# The definition of x is emitted in place of its citation, with the one of y inside it
+		doc = Document().update('see [a][x]\n\n[x]: as in [b][y]\n[y]: http://y\n')
+		self.assertIn('http://y', doc.emit('rtf', **rtf_options))
+		doc.update('[y]: http://z\n', 4, 5)
+		output = doc.emit('rtf', **rtf_options)
+		self.assertIn('http://z', output)
+		self.assertNotIn('http://y', output)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,110 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from jotdown import build
+
+styles = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'styles')
+options = {
+	'html': {'stylesheet': os.path.join(styles, 'solarized.css'), 'embed_css': False, 'ref_style': True},
+	'latex': {'stylesheet': os.path.join(styles, 'solarized.tex'), 'ref_style': True},
+	'rtf': {'stylesheet': os.path.join(styles, 'solarized.rtf'), 'ref_style': True},
+	'jd': {},
+}
+
+SOURCE = """# Title [^note]
+
+Some *text* and $x^2$, see [this][site].
+
+1. One
+2. Two
+
+[site]: http://example.com
+[^note]: A note
+"""
+
+
+class WatchTest(unittest.TestCase):
+	def test_errors_keep_watching(self) -> None:
+		calls = []
+
+		def failing_build() -> int:
+			calls.append(len(calls))
+			if len(calls) == 1:
+				raise IndexError('edited halfway')
+			if len(calls) == 2:
+				return 1
+			raise KeyboardInterrupt
+
+		with self.assertLogs(level='ERROR') as logs:
+			build.watch(failing_build, interval=0)
+		self.assertEqual(len(calls), 3)
+		self.assertIn('edited halfway', logs.output[0])
+
+	def test_missing_file_is_unchanged(self) -> None:
+		with tempfile.TemporaryDirectory() as tmpdir:
+			infile = os.path.join(tmpdir, 'a.jd')
+			outfile = os.path.join(tmpdir, 'a.html')
+			builds = []
+
+			def fake_watch(build_once, interval) -> None:
+				with open(infile, 'w') as f:
+					f.write('Hello\n')
+				builds.append(build_once())
+				os.remove(infile)  # As during an atomic save
+				builds.append(build_once())
+
+			with mock.patch.object(build, 'watch', fake_watch), mock.patch.object(build, 'write_file') as write_file:
+				build.watch_file(infile, outfile)
+			self.assertEqual(builds, [1, 0])
+			write_file.assert_called_once()
+
+
+class ParseCacheTest(unittest.TestCase):
+	def setUp(self) -> None:
+		tmpdir = tempfile.TemporaryDirectory()
+		self.addCleanup(tmpdir.cleanup)
+		self.infile = os.path.join(tmpdir.name, 'a.jd')
+		self.cache_dir = os.path.join(tmpdir.name, 'cache')
+		with open(self.infile, 'w', encoding='utf-8') as f:
+			f.write(SOURCE)
+
+	def cache_files(self) -> list:
+		return [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)]
+
+	def test_loaded_document_emits_the_same(self) -> None:
+		fresh = build.parse_file(self.infile)
+		build.parse_file(self.infile, self.cache_dir)
+		with mock.patch.object(build, 'parse', side_effect=AssertionError('parsed again')):
+			cached = build.parse_file(self.infile, self.cache_dir)
+		for fformat, kwargs in options.items():
+			self.assertEqual(cached.emit(fformat, **kwargs), fresh.emit(fformat, **kwargs), fformat)
+
+	@unittest.skipUnless(hasattr(os, 'getuid'), 'POSIX only')
+	def test_directory_is_private(self) -> None:
+		build.parse_file(self.infile, self.cache_dir)
+		self.assertEqual(os.stat(self.cache_dir).st_mode & 0o777, 0o700)
+		self.assertTrue(all(name.endswith('.json') for name in os.listdir(self.cache_dir)))
+
+	def test_corrupt_file_is_parsed_again(self) -> None:
+		build.parse_file(self.infile, self.cache_dir)
+		for cache_file in self.cache_files():
+			with open(cache_file, 'w') as f:
+				f.write('{"types": ')
+		with self.assertLogs(level='WARNING'):
+			doc = build.parse_file(self.infile, self.cache_dir)
+		self.assertEqual(doc.emit('jd'), build.parse_file(self.infile).emit('jd'))
+
+	@unittest.skipUnless(hasattr(os, 'getuid'), 'POSIX only')
+	def test_files_of_other_users_are_ignored(self) -> None:
+		build.parse_file(self.infile, self.cache_dir)
+		with mock.patch.object(os, 'getuid', return_value=os.getuid() + 1), \
+				mock.patch.object(build, '_load_document', side_effect=AssertionError('loaded')), \
+				self.assertLogs(level='WARNING') as logs:
+			build.parse_file(self.infile, self.cache_dir)
+		self.assertIn('another user', logs.output[0])
+
+
+if __name__ == '__main__':
+	unittest.main()
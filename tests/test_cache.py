@@ -0,0 +1,41 @@
+import threading
+import unittest
+
+from jotdown.cache import LRUCache
+
+
+class LRUCacheTest(unittest.TestCase):
+	def test_evicts_least_recently_used(self) -> None:
+		cache = LRUCache(2)
+		cache.put('a', 1)
+		cache.put('b', 2)
+		self.assertEqual(cache.get('a'), 1)
+		cache.put('c', 3)
+		self.assertIsNone(cache.get('b'))
+		self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'evictions': 1, 'size': 2, 'maxsize': 2})
+
+	def test_threads(self) -> None:
+		cache = LRUCache(8)
+		errors = []
+
+		def use() -> None:
+			try:
+				for i in range(20000):
+					if cache.get(i % 16) is None:
+						cache.put(i % 16, i)
+			except Exception as e:
+				errors.append(e)
+
+		threads = [threading.Thread(target=use) for _ in range(8)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		self.assertEqual(errors, [])
+		stats = cache.stats()
+		self.assertEqual(stats['hits'] + stats['misses'], 8 * 20000)
+		self.assertLessEqual(len(cache), 8)
+
+
+if __name__ == '__main__':
+	unittest.main()
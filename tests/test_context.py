@@ -0,0 +1,26 @@
+import io
+import unittest
+
+from jotdown.parser import parse
+
+
+def anchors(source: str) -> list:
+	return [entry.ident for entry in parse(io.StringIO(source)).context.toc]
+
+
+class AnchorTest(unittest.TestCase):
+	def test_repeated_headings(self) -> None:
+		self.assertEqual(anchors('# Notes\n\n# Notes\n\nNotes\n=====\n'), ['Notes', 'Notes_', 'Notes__'])
+
+	def test_html_text(self) -> None:
+		# Anchors are made from the HTML of the heading without its tags, escaped once more
+		self.assertEqual(anchors('# A & B < C\n'), ['A-&amp;amp;-B-&amp;lt;-C'])
+		self.assertEqual(anchors('# Math «x^2 + y»\n'), ['Math-x2-+-y'])
+		self.assertEqual(anchors('# Image ![alt](pic.png "title")\n'), ['Image-title'])
+
+	def test_citation(self) -> None:
+		self.assertEqual(anchors('# See [this][x]\n\n[x]: http://x\n'), ['See-this[1]'])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,53 @@
+import io
+import os
+import sys
+import unittest
+
+from jotdown.classes import Blockquote, Paragraph, Plaintext
+from jotdown.parser import parse
+
+styles = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'styles')
+rtf_options = {'stylesheet': os.path.join(styles, 'solarized.rtf'), 'ref_style': True}
+
+
+class EmitTest(unittest.TestCase):
+	def test_ordered_list(self) -> None:
+		doc = parse(io.StringIO('1. One\n2. Two\n'))
+		self.assertEqual(
+			doc.children[0].emit('html'),
+			'<ol start="1" type="1"><li><span>One\n</span><li><span>Two\n</span></ol>'
+		)
+
+	def test_deep_nesting(self) -> None:
+		node = Paragraph([Plaintext('deep')])
+		depth = sys.getrecursionlimit() * 2
+		for _ in range(depth):
+			node = Blockquote([node])
+		for fmt in ('html', 'latex', 'rtf', 'jd', 'plain'):
+			self.assertIn('deep', node.emit(fmt), fmt)
+		self.assertTrue(node.emit('html').startswith('<blockquote>' * depth + '<p>deep'))
+
+	def test_emit_to(self) -> None:
+		doc = parse(io.StringIO('Some *text* and «x^2»\n\n> quoted\n\n1. One\n'))
+		for child in doc.children:
+			for fmt in ('html', 'latex', 'rtf', 'jd', 'plain'):
+				stream = io.BytesIO()
+				child.emit_to(stream, fmt, chunk_size=4, context=doc.context)
+				self.assertEqual(stream.getvalue().decode('utf-8'), child.emit(fmt, context=doc.context), fmt)
+
+
+	def test_reference_cycles(self) -> None:
+		# RTF footnotes hold the definitions they cite, which must not cite themselves again
+		for source in (
+			'see [a][r1]\n\n[r1]: see [c][r1]\n',
+			'see [a][r1]\n\n[r1]: see [b][r2]\n[r2]: see [c][r1]\n',
+		):
+			with self.assertRaisesRegex(Exception, 'Reference "r1" cites itself'):
+				parse(io.StringIO(source)).emit('rtf', **rtf_options)
+
+		output = parse(io.StringIO('see [a][r1]\n\n[r1]: see [b][r2]\n[r2]: http://x\n')).emit('rtf', **rtf_options)
+		self.assertEqual(output.count(r'{\footnote'), 2)
+
+
+if __name__ == '__main__':
+	unittest.main()
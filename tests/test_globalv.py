@@ -0,0 +1,49 @@
+import os
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+from jotdown import globalv
+
+
+def fake_detect(data: bytes) -> dict:
+	try:
+		data.decode('utf-8')
+		return {'encoding': 'utf-8'}
+	except UnicodeDecodeError:
+		return {'encoding': 'windows-1252'}
+
+
+class EncodingTest(unittest.TestCase):
+	def setUp(self) -> None:
+		globalv.directory_encodings.clear()
+		self.chardet = mock.patch.dict(sys.modules, {'chardet': types.SimpleNamespace(detect=fake_detect)})
+		self.chardet.start()
+
+	def tearDown(self) -> None:
+		self.chardet.stop()
+		globalv.directory_encodings.clear()
+
+	def test_utf8_after_cp1252_sibling(self) -> None:
+		with tempfile.TemporaryDirectory() as tmpdir:
+			latin = os.path.join(tmpdir, 'a.jd')
+			utf8 = os.path.join(tmpdir, 'b.jd')
+			with open(latin, 'wb') as f:
+				f.write('Café crème\n'.encode('cp1252'))
+			with open(utf8, 'wb') as f:
+				f.write('Naïve — résumé\n'.encode('utf-8'))
+
+			self.assertEqual(globalv.read_with_encoding(latin), 'Café crème\n')
+			self.assertEqual(globalv.read_with_encoding(utf8), 'Naïve — résumé\n')
+			self.assertEqual(''.join(globalv.read_lines_with_encoding(utf8)), 'Naïve — résumé\n\n')
+
+	def test_reuses_strict_encodings(self) -> None:
+		self.assertTrue(globalv._reuses_encoding('あ'.encode('shift_jis'), 'shift_jis', True))
+		self.assertFalse(globalv._reuses_encoding(b'plain', 'cp1252', True))
+		self.assertFalse(globalv._reuses_encoding('é'.encode('utf-8'), 'shift_jis', True))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+
+from jotdown.lexer import TextToken, get_text_tokens, replace_math
+
+
+def tokens(text: str) -> list:
+	return list(get_text_tokens(1, text))
+
+
+class TextTokenTest(unittest.TestCase):
+	def test_underscores_inside_words(self) -> None:
+		self.assertEqual(tokens('snake_case and _em_'), [
+			(TextToken.Plaintext, ('snake_case ',)),
+			(TextToken.Plaintext, ('and ',)),
+			(TextToken.Emph_B_AMB, ()),
+			(TextToken.Plaintext, ('em',)),
+			(TextToken.Emph_B_AMB, ()),
+		])
+
+	def test_adjacent_tokens(self) -> None:
+		self.assertEqual([token for token, _ in tokens('**bold**_em_')], [
+			TextToken.Strong_A_AMB, TextToken.Plaintext, TextToken.Strong_A_AMB,
+			TextToken.Emph_B_AMB, TextToken.Plaintext, TextToken.Emph_B_AMB,
+		])
+
+	def test_code_keeps_its_text(self) -> None:
+		self.assertEqual(tokens('`a_b_` _c_d_'), [
+			(TextToken.CodeInline_AMB, ()),
+			(TextToken.Plaintext, ('a_b_',)),
+			(TextToken.CodeInline_AMB, ('`',)),
+			(TextToken.Plaintext, (' ',)),
+			(TextToken.Emph_B_AMB, ()),
+			(TextToken.Plaintext, ('c_d',)),
+			(TextToken.Emph_B_AMB, ()),
+		])
+
+	def test_long_line(self) -> None:
+		# Every token is found at its offset of the one line, which is never sliced again
+		text = 'word *emph* ' * 2000
+		found = tokens(text)
+		self.assertEqual(sum(token == TextToken.Emph_A_AMB for token, _ in found), 4000)
+		self.assertEqual(''.join(groups[0] for token, groups in found if token == TextToken.Plaintext), 'word emph ' * 2000)
+
+
+class ReplaceMathTest(unittest.TestCase):
+	def test_longer_symbols_first(self) -> None:
+		self.assertEqual(replace_math('A <-> B -> C <- D'), 'A ↔ B → C ← D')
+		self.assertEqual(replace_math('A !©= B, A !© B, A ©= B, A © B'), 'A ⊈ B, A ⊄ B, A ⊆ B, A ⊂ B')
+		self.assertEqual(replace_math('x-1 +/- 2'), 'x−1 ± 2')
+
+	def test_not_in(self) -> None:
+		# '€' used to be replaced before '!€' was tried
+		self.assertEqual(replace_math('x !€ A, y € B'), 'x ∉ A, y ∈ B')
+
+	def test_whole_words(self) -> None:
+		self.assertEqual(replace_math('FORALL x € NATURALS'), '∀ x ∈ ℕ')
+		self.assertEqual(replace_math('INFO INF alphabet alpha'), 'INFO ∞ alphabet α')
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,187 @@
+import io
+import os
+import random
+import unittest
+
+from jotdown.classes import Document, block_cache
+from jotdown.context import ParseContext
+from jotdown.errors import MissingTagException
+from jotdown.lexer import split_blocks
+from jotdown.parser import parse, parse_iter
+
+styles = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'styles')
+html_options = {'stylesheet': os.path.join(styles, 'solarized.css'), 'embed_css': False}
+latex_options = {'stylesheet': os.path.join(styles, 'solarized.tex')}
+
+SOURCE = [
+	'# One\n',
+	'\n',
+	'See [this][x]\n',
+	'\n',
+	'```\n',
+	'code\n',
+	'```\n',
+	'\n',
+	'[x]: http://x\n',
+]
+
+
+class ParseIterTest(unittest.TestCase):
+	def setUp(self) -> None:
+		self.read = []
+
+	def lines(self):
+		for line in SOURCE:
+			self.read.append(line)
+			yield line
+
+	def test_yields_as_blocks_are_read(self) -> None:
+		context = ParseContext()
+		nodes = parse_iter(self.lines(), context)
+		next(nodes)
+		self.assertEqual(len(self.read), 2)
+		paragraph = next(nodes)
+		self.assertEqual(len(self.read), 4)
+		self.assertFalse(context.finalized)
+
+		# Citations only need the place of their reference in the list, but links need its definition
+		self.assertIn('>1</a>]</cite>', paragraph.emit('html', context=context, ref_style=True))
+		with self.assertRaisesRegex(Exception, 'not defined yet'):
+			paragraph.emit('html', context=context)
+
+		list(nodes)
+		self.assertTrue(context.finalized)
+		self.assertEqual(len(self.read), len(SOURCE))
+
+	def test_streamed_document(self) -> None:
+		context = ParseContext()
+		streamed = Document(parse_iter(self.lines(), context), context=context)
+		self.assertEqual(
+			streamed.emit('html', ref_style=True, **html_options),
+			parse(SOURCE).emit('html', ref_style=True, **html_options)
+		)
+
+	def test_code_emitted_twice(self) -> None:
+		code_block = parse(SOURCE).children[2]
+		for fmt in ('html', 'latex', 'jd', 'plain'):
+			self.assertIn('code', code_block.emit(fmt), fmt)
+			self.assertEqual(code_block.emit(fmt), code_block.emit(fmt), fmt)
+
+
+NOTES = [
+	'# Notes\n',
+	'\n',
+	'First paragraph, see [this][x].\n',
+	'\n',
+	'## Notes\n',
+	'\n',
+	'1. One\n',
+	'2. Two\n',
+	'\n',
+	'```\n',
+	'code\n',
+	'\n',
+	'more code\n',
+	'```\n',
+	'\n',
+	'Last [that][y]\n',
+	'\n',
+	'[x]: http://x\n',
+	'[y]: http://y\n',
+]
+
+
+class UpdateTest(unittest.TestCase):
+	def assertParsedAgain(self, doc: Document, lines: list) -> None:
+		"""
+		doc is the same as a fresh parse of lines
+		"""
+		outputs = []
+		for document in (doc, parse(lines)):
+			block_cache.clear()
+			outputs.append([
+				document.emit('html', ref_style=True, **html_options),
+				document.emit('latex', ref_style=True, **latex_options),
+				document.emit('jd'),
+				document.emit('plain'),
+				[(entry.level, entry.ident) for entry in document.context.toc],
+			])
+		self.assertEqual(outputs[0], outputs[1])
+		self.assertEqual(doc.source.lines, lines)
+		self.assertEqual(doc.source.offsets, [line_offset for line_offset, _ in split_blocks(lines)])
+
+	def edit(self, doc: Document, lines: list, start: int, end: int, replacement: list) -> list:
+		doc.update(''.join(replacement), start, end)
+		lines = lines[:start - 1] + replacement + lines[end - 1:]
+		self.assertParsedAgain(doc, lines)
+		return lines
+
+	def test_whole_source(self) -> None:
+		doc = Document()
+		doc.update(''.join(NOTES))
+		self.assertParsedAgain(doc, NOTES)
+
+		lines = NOTES[:2] + ['# Notes\n', '\n'] + NOTES[2:]
+		doc.update(''.join(lines))
+		self.assertParsedAgain(doc, lines)
+		self.assertEqual([entry.ident for entry in doc.context.toc], ['Notes', 'Notes_', 'Notes__'])
+
+	def test_edits(self) -> None:
+		doc = Document()
+		doc.update(''.join(NOTES))
+		lines = NOTES
+		lines = self.edit(doc, lines, 3, 4, ['First paragraph, edited.\n'])
+		lines = self.edit(doc, lines, 5, 6, ['# Notes\n'])  # Renames the anchors of later headings
+		lines = self.edit(doc, lines, 16, 16, ['[z]: http://z\n', 'See [z][z]\n', '\n'])  # References are renumbered
+		lines = self.edit(doc, lines, 10, 15, ['code\n', '\n', 'more code\n'])  # The code block is split
+		lines = self.edit(doc, lines, 10, 13, ['```\n', 'code\n', '\n', 'more code\n', '```\n'])  # And joined again
+		lines = self.edit(doc, lines, 1, len(lines) + 1, [])
+		lines = self.edit(doc, lines, 1, 1, NOTES)
+
+	def test_keeps_other_blocks(self) -> None:
+		doc = Document()
+		doc.update(''.join(NOTES))
+		before = list(doc.children)
+		doc.update('First paragraph, edited.\n', 3, 4)
+		# The Block before an edit is split again too, in case the edit joins them
+		self.assertEqual([a is b for a, b in zip(before, doc.children)], [False, False, True, True, True, True])
+
+	def test_random_edits(self) -> None:
+		rng = random.Random(4)
+		replacements = [
+			[], ['\n'], ['# Notes\n'], ['```\n'], ['See [x][x]\n'], ['[x]: http://other\n'], ['> quoted\n'],
+		]
+		doc = Document()
+		doc.update(''.join(NOTES))
+		lines = NOTES
+		for _ in range(200):
+			start = rng.randint(1, len(lines) + 1)
+			end = min(len(lines) + 1, start + rng.randint(0, 3))
+			replacement = rng.choice(replacements + [rng.sample(NOTES, 4)])
+			new_lines = lines[:start - 1] + replacement + lines[end - 1:]
+			try:
+				parse(new_lines).emit('html', ref_style=True, **html_options)
+			except Exception:
+				continue  # Only edits that leave a valid source
+			if rng.random() < 0.5:
+				doc.update(''.join(new_lines))
+				self.assertParsedAgain(doc, new_lines)
+				lines = new_lines
+			else:
+				lines = self.edit(doc, lines, start, end, replacement)
+
+	def test_first_update_needs_whole_source(self) -> None:
+		with self.assertRaises(ValueError):
+			Document().update('text\n', 1, 1)
+
+	def test_last_block_line_number(self) -> None:
+		self.assertEqual(list(split_blocks(['a\n', '\n', 'b\n', 'c'])), [(1, ['a\n']), (3, ['b\n', 'c'])])
+		self.assertEqual(list(split_blocks(['b\n', 'c\n'], 5)), [(6, ['b\n', 'c\n'])])
+		for source in ('a\n\nb\n*c', 'a\n\nb\n*c\n'):
+			with self.assertRaises(MissingTagException) as error:
+				parse(io.StringIO(source))
+			self.assertEqual(error.exception.line_number, 3)
+
+
+if __name__ == '__main__':
+	unittest.main()